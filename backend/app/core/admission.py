@@ -0,0 +1,99 @@
+import asyncio
+import json
+import math
+from typing import List, Optional
+from .config import settings
+from .logging import logger
+
+class EndpointClass:
+    """Concurrency limit and queue-time budget shared by all routes under some path prefixes"""
+
+    def __init__(self, name: str, prefixes: List[str], max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.prefixes = prefixes
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        return self._slots
+
+    def matches(self, path: str) -> bool:
+        return any(path.startswith(prefix) for prefix in self.prefixes)
+
+    def snapshot(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "max_concurrent": self.max_concurrent
+        }
+
+# Full-scan analytics routes; everything else (ticket workflow) is never queued here
+def default_endpoint_classes() -> List[EndpointClass]:
+    api = settings.API_V1_STR
+    return [
+        EndpointClass("statistics", [f"{api}/statistics"], max_concurrent=4, max_queue=8, queue_timeout=2.0),
+        EndpointClass("performance", [f"{api}/performance"], max_concurrent=2, max_queue=4, queue_timeout=2.0),
+        EndpointClass("export", [f"{api}/export"], max_concurrent=1, max_queue=2, queue_timeout=5.0),
+    ]
+
+endpoint_classes = default_endpoint_classes()
+
+class AdmissionControlMiddleware:
+    """Sheds load on expensive endpoint classes with a fast 503 + Retry-After, instead of
+    letting them pile up on the event loop shared with latency-critical routes."""
+
+    def __init__(self, app, classes: Optional[List[EndpointClass]] = None):
+        self.app = app
+        self.classes = classes if classes is not None else endpoint_classes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        cls = next((c for c in self.classes if c.matches(scope["path"])), None)
+        if cls is None:
+            return await self.app(scope, receive, send)
+
+        if cls.waiting >= cls.max_queue:
+            return await self._reject(cls, scope, send)
+        cls.waiting += 1
+        try:
+            await asyncio.wait_for(cls.slots.acquire(), timeout=cls.queue_timeout)
+        except asyncio.TimeoutError:
+            return await self._reject(cls, scope, send)
+        finally:
+            cls.waiting -= 1
+
+        cls.in_flight += 1
+        cls.admitted += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            cls.in_flight -= 1
+            cls.slots.release()
+
+    async def _reject(self, cls: EndpointClass, scope, send):
+        cls.rejected += 1
+        retry_after = max(1, math.ceil(cls.queue_timeout))
+        logger.warning(f"Admission control rejected {scope['path']} ({cls.name}: {cls.in_flight} running, {cls.waiting} waiting)")
+        body = json.dumps({"detail": "Server sedang sibuk, silakan coba lagi"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,42 @@
+import hashlib
+import secrets
+from typing import Dict, Optional
+from .config import settings
+from .logging import logger
+from ..models.user import User
+
+# Service accounts (the Telegram bot) authenticate with an X-API-Key header instead of
+# logging in. Keys are configured as "name:role:sha256(key)" entries in SERVICE_API_KEYS
+# and loaded into memory at startup, so checking one is a hash and a dict lookup.
+API_KEY_HEADER = "X-API-Key"
+SERVICE_ROLES = ["admin", "agent"]
+
+_service_accounts: Dict[str, User] = {}
+
+def hash_api_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+def generate_api_key() -> str:
+    return f"sdv_{secrets.token_urlsafe(32)}"
+
+def load_service_keys():
+    """(Re)build the key table from settings"""
+    accounts = {}
+    for entry in settings.SERVICE_API_KEYS:
+        try:
+            name, role, key_hash = entry.split(":")
+        except ValueError:
+            logger.error("Ignoring malformed SERVICE_API_KEYS entry (expected name:role:sha256)")
+            continue
+        if role not in SERVICE_ROLES:
+            logger.error(f"Ignoring service key {name}: role {role} not allowed")
+            continue
+        accounts[key_hash.lower()] = User(
+            id=f"service:{name}", username=name, full_name=name, role=role, status="approved"
+        )
+    _service_accounts.clear()
+    _service_accounts.update(accounts)
+    logger.info(f"Loaded {len(accounts)} service API keys")
+
+def get_service_account(api_key: str) -> Optional[User]:
+    return _service_accounts.get(hash_api_key(api_key))
@@ -16,16 +16,30 @@ class Settings(BaseSettings):
     MONGO_URL: str = "mongodb://localhost:27017"
     DB_NAME: str = "telegram_ticket_db"
     REDIS_URL: str = "redis://localhost:6379"
+    SLOW_QUERY_THRESHOLD_MS: int = 100  # Mongo commands logged as slow (see core/slow_queries.py)
+    SLOW_QUERY_EXPLAIN: bool = False  # Explain each new slow query shape to flag collection scans
+    REQUEST_DB_CALLS_WARN: int = 25  # Mongo + Redis round trips per request logged as a warning (N+1)
     
     # Security
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24  # 24 hours
+    PASSWORD_HASH_WORKERS: int = 2  # Threads running bcrypt
+    PASSWORD_HASH_MAX_PENDING: int = 32  # Hash/verify calls allowed in flight before 503
+    SERVICE_API_KEYS: List[str] = []  # "name:role:sha256(key)", see generate_api_key.py
     
     # CORS
     CORS_ORIGINS: List[str] = ["http://localhost:3000", "http://localhost:8004", "https://roc-6-sdv-bges.site"]
     
+    # Rate limiting (cost units per user per minute, see core/rate_limit.py)
+    RATE_LIMIT_ANALYTICS_PER_MINUTE: int = 120
+    
+    # Auto-assignment
+    MAX_TICKETS_PER_AGENT: int = 5
+    ASSIGNMENT_QUEUE_MAX: int = 500  # Tickets waiting for a slot; beyond this they stay open for manual claim
+    
     # Bot
+    TELEGRAM_OUTBOX_ENABLED: bool = False  # Stream new comments to telegram:outbox; enable only with a consumer reading it
     BOT_TOKEN: Optional[str] = None
     GROUP_CHAT_ID: Optional[str] = None
 
@@ -1,13 +1,97 @@
+import time
 from motor.motor_asyncio import AsyncIOMotorClient
 import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+from pymongo import monitoring
+from pymongo.errors import OperationFailure
 from .config import settings
+from .logging import logger
+from .metrics import MONGO_COMMAND_SECONDS, REDIS_COMMAND_SECONDS
+from .slow_queries import slow_query_log
+from .request_context import current_timing
+
+class CommandTimer(monitoring.CommandListener):
+    """Feeds every MongoDB command's round-trip time into the metrics registry
+    and the current request's timing"""
+
+    def started(self, event):
+        pass
+
+    def _observe(self, event, outcome: str):
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMAND_SECONDS.observe(seconds, command=event.command_name, outcome=outcome)
+        timing = current_timing.get()
+        if timing is not None:
+            timing.add_mongo(seconds)
+
+    def succeeded(self, event):
+        self._observe(event, "ok")
+
+    def failed(self, event):
+        self._observe(event, "error")
+
+def _observe_redis(seconds: float, command: str, outcome: str):
+    REDIS_COMMAND_SECONDS.observe(seconds, command=command, outcome=outcome)
+    timing = current_timing.get()
+    if timing is not None:
+        timing.add_redis(seconds)
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await super().execute(raise_on_error)
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            _observe_redis(time.perf_counter() - started, "PIPELINE", outcome)
+
+class InstrumentedRedis(redis.Redis):
+    """Redis client timing each command (and each pipeline flush as one PIPELINE)"""
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await super().execute_command(*args, **options)
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            _observe_redis(time.perf_counter() - started, str(args[0]).upper(), outcome)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
 
 # MongoDB
-client = AsyncIOMotorClient(settings.MONGO_URL)
+client = AsyncIOMotorClient(settings.MONGO_URL, event_listeners=[CommandTimer(), slow_query_log])
 db = client[settings.DB_NAME]
 
 # Redis
-redis_client = redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+redis_client = InstrumentedRedis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+
+async def ensure_indexes():
+    """Create the indexes the routers rely on (idempotent, run at startup)"""
+    await db.comments.create_index([("ticket_id", 1), ("timestamp", 1)])
+    await db.comments.create_index("id")
+    await db.comments.create_index(
+        "sent_to_telegram",
+        partialFilterExpression={"sent_to_telegram": False}
+    )
+    await db.tickets.create_index("id")
+    await db.tickets.create_index([("user_telegram_id", 1), ("status", 1), ("created_at", -1)])
+    # Only tickets with unread replies are indexed, which keeps the badge query tiny
+    await db.tickets.create_index(
+        "unread_user_replies",
+        partialFilterExpression={"unread_user_replies": {"$gt": 0}}
+    )
+    try:
+        await db.tickets.create_index("ticket_number", unique=True)
+    except OperationFailure as e:
+        # Legacy random numbers may already collide; clean those up for the index to build
+        logger.error(f"Unique ticket_number index not created: {e}")
 
 async def get_db():
     return db
@@ -1,11 +1,15 @@
-from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from typing import Optional
+from fastapi import Depends, HTTPException, Security, status
+from fastapi.security import APIKeyHeader, HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from .config import settings
 from .database import get_db
+from .user_cache import user_cache
+from .api_keys import API_KEY_HEADER, get_service_account
 from ..models.user import User
 
-security = HTTPBearer()
+security = HTTPBearer(auto_error=False)
+api_key_header = APIKeyHeader(name=API_KEY_HEADER, auto_error=False)
 
 # Admin-level roles (both admin and developer have full access)
 ADMIN_ROLES = ["admin", "developer"]
@@ -14,11 +18,12 @@ def is_admin_role(role: str) -> bool:
     """Check if role has admin-level privileges"""
     return role in ADMIN_ROLES
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db = Depends(get_db)
-) -> User:
-    token = credentials.credentials
+async def get_user_from_token(token: str, db) -> User:
+    """Resolve a bearer token to its user, raising 401 if it is invalid"""
+    cached = user_cache.get(token)
+    if cached is not None:
+        return cached
+    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -36,5 +41,20 @@ async def get_current_user(
     if user is None:
         raise credentials_exception
         
-    return User(**user)
+    user = User(**user)
+    user_cache.put(token, user, payload.get("exp"))
+    return user
 
+async def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    api_key: Optional[str] = Security(api_key_header),
+    db = Depends(get_db)
+) -> User:
+    if api_key:
+        service_account = get_service_account(api_key)
+        if service_account is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="API key tidak valid")
+        return service_account
+    if credentials is None:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authenticated")
+    return await get_user_from_token(credentials.credentials, db)
@@ -0,0 +1,185 @@
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+from .config import settings
+from .logging import logger
+from .request_context import RequestTiming, current_request, current_timing, route_of
+
+# Minimal in-process metrics registry rendered in the Prometheus text format (GET /metrics).
+# Values are per worker; Prometheus aggregates across workers by instance. Updates may come
+# from Motor's executor threads (command listeners), so each metric guards its values with a
+# lock and renders from a snapshot.
+
+_registry: List["_Metric"] = []
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str]) -> str:
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class GaugeFunc(_Metric):
+    """Gauge read from existing state at scrape time: fn() -> {label values tuple: value}"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], fn: Callable[[], Dict[Tuple[str, ...], float]]):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self.fn().items()]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):  # above the last bound only counts toward +Inf
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series[-1] if series else 0
+
+    def _samples(self):
+        with self._lock:
+            snapshot = [(key, list(series)) for key, series in self._series.items()]
+        lines = []
+        for key, series in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, series):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames + ('le',), key + (repr(bound),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames + ('le',), key + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+# HTTP
+HTTP_REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Request latency by route template", ["method", "route", "status"])
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being handled", ["method"])
+
+# Datastores
+MONGO_COMMAND_SECONDS = Histogram("mongo_command_duration_seconds", "MongoDB command latency", ["command", "outcome"])
+REDIS_COMMAND_SECONDS = Histogram("redis_command_duration_seconds", "Redis command latency (pipelines as PIPELINE)", ["command", "outcome"])
+
+# Outbound
+TELEGRAM_SENDS = Counter("telegram_sends_total", "Telegram API send attempts by outcome", ["method", "outcome"])
+
+class RouteTimer:
+    """ASGI middleware observing latency and in-flight requests per route template.
+    Also counts the request's Mongo/Redis round trips, reported in a Server-Timing
+    header and in the access log line."""
+
+    def __init__(self, app):
+        self.app = app
+        # Lets the dashboard (another origin) read Server-Timing in devtools
+        self.timing_allow_origin = ", ".join(settings.CORS_ORIGINS).encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        status = {"code": 500}
+        timing = RequestTiming()
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                server_timing = timing.server_timing(time.perf_counter() - started)
+                message = {**message, "headers": [
+                    *message.get("headers", []),
+                    (b"server-timing", server_timing.encode()),
+                    (b"timing-allow-origin", self.timing_allow_origin),
+                ]}
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(method=method)
+        request_token = current_request.set(scope)
+        timing_token = current_timing.set(timing)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_timing.reset(timing_token)
+            current_request.reset(request_token)
+            HTTP_IN_FLIGHT.dec(method=method)
+            elapsed = time.perf_counter() - started
+            route = route_of(scope)
+            HTTP_REQUEST_SECONDS.observe(elapsed, method=method, route=route, status=status["code"])
+            line = f"{method} {scope['path']} {status['code']} {elapsed * 1000:.0f}ms {timing.summary()}"
+            if timing.mongo_calls + timing.redis_calls > settings.REQUEST_DB_CALLS_WARN:
+                logger.warning(f"{line} (many round trips on {route})")
+            else:
+                logger.info(line)
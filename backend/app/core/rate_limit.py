@@ -0,0 +1,85 @@
+import math
+import time
+from typing import Tuple
+from fastapi import Depends, HTTPException, Request
+from .config import settings
+from .database import get_redis, redis_client
+from .deps import get_current_user
+from .logging import logger
+from ..models.user import User
+
+# Sliding-window limits shared by every worker. Each (bucket, identity) has a budget of
+# `limit` cost units per window; routes spend different amounts of the same budget, so
+# e.g. one export costs as much as many dashboard refreshes.
+#
+# The window slides by weighting the previous fixed window's total by how much of it
+# still overlaps the sliding window (two counters per identity, no per-request entries).
+_SLIDING_WINDOW_LUA = """
+local window_ms = tonumber(ARGV[3])
+local elapsed = tonumber(ARGV[4])
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local used = previous * (window_ms - elapsed) / window_ms + current
+if used + tonumber(ARGV[1]) > tonumber(ARGV[2]) then
+    return window_ms - elapsed
+end
+redis.call('INCRBY', KEYS[1], ARGV[1])
+redis.call('PEXPIRE', KEYS[1], window_ms * 2)
+return 0
+"""
+
+_sliding_window_script = redis_client.register_script(_SLIDING_WINDOW_LUA)
+
+async def hit(redis, bucket: str, identity: str, cost: int, limit: int, window_seconds: int) -> Tuple[bool, int]:
+    """Spend `cost` units of an identity's budget. Returns (allowed, retry-after seconds)."""
+    window_ms = window_seconds * 1000
+    now_ms = int(time.time() * 1000)
+    window_index, elapsed = divmod(now_ms, window_ms)
+    prefix = f"ratelimit:{bucket}:{identity}"
+    try:
+        wait_ms = await _sliding_window_script(
+            keys=[f"{prefix}:{window_index}", f"{prefix}:{window_index - 1}"],
+            args=[cost, limit, window_ms, elapsed],
+            client=redis
+        )
+    except Exception as e:
+        # Fail open: losing Redis must not take the API down with it
+        logger.error(f"Rate limit check failed for {bucket}: {e}")
+        return True, 0
+    return wait_ms == 0, math.ceil(wait_ms / 1000)
+
+def _reject(retry_after: int):
+    raise HTTPException(
+        status_code=429,
+        detail=f"Terlalu banyak permintaan, coba lagi dalam {retry_after} detik",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+def ip_rate_limit(bucket: str, limit: int, window_seconds: int = 60):
+    """Dependency limiting unauthenticated routes (login, register) per client IP"""
+    async def check(request: Request, redis = Depends(get_redis)):
+        identity = request.client.host if request.client else "unknown"
+        allowed, retry_after = await hit(redis, bucket, identity, 1, limit, window_seconds)
+        if not allowed:
+            logger.warning(f"Rate limit {bucket} hit by {identity}")
+            _reject(retry_after)
+    return check
+
+def user_rate_limit(bucket: str, cost: int, limit: int, window_seconds: int = 60):
+    """Dependency spending `cost` units of the current user's `bucket` budget"""
+    async def check(current_user: User = Depends(get_current_user), redis = Depends(get_redis)):
+        allowed, retry_after = await hit(redis, bucket, current_user.id, cost, limit, window_seconds)
+        if not allowed:
+            logger.warning(f"Rate limit {bucket} hit by {current_user.username}")
+            _reject(retry_after)
+    return check
+
+# Route costs against the per-user analytics budget (RATE_LIMIT_ANALYTICS_PER_MINUTE).
+# The ticket workflow has no budget, so analytics traffic can't starve it.
+ANALYTICS_BUCKET = "analytics"
+STATISTICS_COST = 1
+PERFORMANCE_COST = 5
+EXPORT_COST = 20
+
+def analytics_rate_limit(cost: int):
+    return user_rate_limit(ANALYTICS_BUCKET, cost, settings.RATE_LIMIT_ANALYTICS_PER_MINUTE)
@@ -0,0 +1,59 @@
+import threading
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+# ASGI scope of the request being handled, set by RouteTimer. Motor copies the context
+# into its executor threads, so pymongo command listeners can see it too.
+current_request: ContextVar[Optional[dict]] = ContextVar("current_request", default=None)
+
+class RequestTiming:
+    """Mongo/Redis round trips made while handling one request. Mongo's listener reports
+    from Motor's executor threads, and concurrent queries can overlap, so the summed
+    time may exceed the request's wall time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.mongo_calls = 0
+        self.mongo_seconds = 0.0
+        self.redis_calls = 0
+        self.redis_seconds = 0.0
+
+    def add_mongo(self, seconds: float):
+        with self._lock:
+            self.mongo_calls += 1
+            self.mongo_seconds += seconds
+
+    def add_redis(self, seconds: float):
+        with self._lock:
+            self.redis_calls += 1
+            self.redis_seconds += seconds
+
+    def server_timing(self, app_seconds: float) -> str:
+        return ", ".join([
+            f'mongo;desc="{self.mongo_calls} calls";dur={self.mongo_seconds * 1000:.1f}',
+            f'redis;desc="{self.redis_calls} calls";dur={self.redis_seconds * 1000:.1f}',
+            f"app;dur={app_seconds * 1000:.1f}",
+        ])
+
+    def summary(self) -> str:
+        return (f"mongo={self.mongo_calls}/{self.mongo_seconds * 1000:.0f}ms "
+                f"redis={self.redis_calls}/{self.redis_seconds * 1000:.0f}ms")
+
+current_timing: ContextVar[Optional[RequestTiming]] = ContextVar("current_timing", default=None)
+
+_route_paths: Dict[Callable, str] = {}
+
+def route_of(scope: dict) -> str:
+    """Route template ("/api/tickets/{ticket_id}") of a scope the router has already matched"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    if endpoint not in _route_paths:
+        path = next((getattr(route, "path", None) for route in scope["app"].routes
+                     if getattr(route, "endpoint", None) is endpoint), None)
+        _route_paths[endpoint] = path or "unmatched"
+    return _route_paths[endpoint]
+
+def current_route() -> Optional[str]:
+    scope = current_request.get()
+    return route_of(scope) if scope is not None else None
@@ -1,16 +1,67 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Any, Union
+from fastapi import HTTPException
 from jose import jwt
 from passlib.context import CryptContext
 from .config import settings
+from .logging import logger
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+# bcrypt burns ~250ms of CPU per call, so it runs on a small dedicated pool instead of
+# the event loop. Calls beyond PASSWORD_HASH_MAX_PENDING are rejected rather than queued.
+_hash_pool = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+SLOW_HASH_WAIT_SECONDS = 1.0
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+class PasswordHashStats:
+    def __init__(self):
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            **vars(self),
+            "workers": settings.PASSWORD_HASH_WORKERS,
+            "max_pending": settings.PASSWORD_HASH_MAX_PENDING
+        }
+
+hash_stats = PasswordHashStats()
+
+def _timed(fn, submitted: float, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, started - submitted, time.perf_counter() - started
+
+async def _run_in_hash_pool(fn, *args):
+    if hash_stats.in_flight >= settings.PASSWORD_HASH_MAX_PENDING:
+        hash_stats.rejected += 1
+        raise HTTPException(status_code=503, detail="Server sedang sibuk, silakan coba lagi", headers={"Retry-After": "1"})
+    hash_stats.in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        result, wait, run = await loop.run_in_executor(_hash_pool, _timed, fn, time.perf_counter(), *args)
+    finally:
+        hash_stats.in_flight -= 1
+    hash_stats.completed += 1
+    hash_stats.total_wait_seconds += wait
+    hash_stats.total_run_seconds += run
+    hash_stats.max_wait_seconds = max(hash_stats.max_wait_seconds, wait)
+    if wait > SLOW_HASH_WAIT_SECONDS:
+        logger.warning(f"Password hashing queued for {wait:.2f}s ({hash_stats.in_flight} in flight)")
+    return result
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run_in_hash_pool(pwd_context.verify, plain_password, hashed_password)
+
+async def get_password_hash(password: str) -> str:
+    return await _run_in_hash_pool(pwd_context.hash, password)
 
 def create_access_token(subject: Union[str, Any], expires_delta: Optional[timedelta] = None) -> str:
     if expires_delta:
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+from pymongo import monitoring
+from .config import settings
+from .logging import logger
+from .request_context import current_route
+
+# Mongo commands slower than SLOW_QUERY_THRESHOLD_MS, grouped by query shape (the
+# filter/pipeline with literal values replaced by "?") and attributed to the route
+# that issued them. With SLOW_QUERY_EXPLAIN on, each new slow shape is explained once
+# in the background and flagged if its winning plan is a collection scan.
+#
+# Listener callbacks run on Motor's executor threads, hence the lock.
+
+# Parts of each read/match command that make up its shape
+QUERY_FIELDS = {
+    "find": ("filter", "sort"),
+    "aggregate": ("pipeline",),
+    "count": ("query",),
+    "distinct": ("key", "query"),
+    "findAndModify": ("query", "sort"),
+    "update": ("updates",),
+    "delete": ("deletes",),
+}
+# Session/transport fields that explain rejects
+COMMAND_META_FIELDS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber",
+                       "autocommit", "startTransaction", "readConcern", "writeConcern"}
+
+MAX_SHAPES = 500
+MAX_RECENT = 100
+EXPLAIN_INTERVAL_SECONDS = 5
+
+def _mask(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _mask(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # $and/$or/pipelines keep their structure; literal arrays ($in) collapse
+        if value and all(isinstance(item, dict) for item in value):
+            return [_mask(item) for item in value]
+        return "?"
+    return "?"
+
+def query_shape(command_name: str, command: dict) -> str:
+    parts = {}
+    for field in QUERY_FIELDS[command_name]:
+        if field not in command:
+            continue
+        value = command[field]
+        if field in ("updates", "deletes"):
+            value = [{"q": item.get("q", {})} for item in value]
+        parts[field] = value if field == "key" else _mask(value)
+    return json.dumps(parts, sort_keys=True, default=str)
+
+def _has_collscan(plan: Any) -> bool:
+    if isinstance(plan, dict):
+        return plan.get("stage") == "COLLSCAN" or any(_has_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_collscan(item) for item in plan)
+    return False
+
+def find_collscan(explain: Any) -> bool:
+    """True if any winning plan in an explain result (find or aggregate) scans a collection"""
+    if isinstance(explain, dict):
+        if "winningPlan" in explain and _has_collscan(explain["winningPlan"]):
+            return True
+        return any(find_collscan(value) for key, value in explain.items() if key != "rejectedPlans")
+    if isinstance(explain, list):
+        return any(find_collscan(item) for item in explain)
+    return False
+
+class SlowQueryLog(monitoring.CommandListener):
+    def __init__(self, threshold_ms: Optional[int] = None, explain: Optional[bool] = None):
+        self.threshold_ms = settings.SLOW_QUERY_THRESHOLD_MS if threshold_ms is None else threshold_ms
+        self.explain = settings.SLOW_QUERY_EXPLAIN if explain is None else explain
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple, Tuple[dict, Optional[str]]] = {}
+        self._to_explain: deque = deque(maxlen=50)
+        self.shapes: Dict[Tuple[str, str, str], dict] = {}
+        self.recent: deque = deque(maxlen=MAX_RECENT)
+        self.dropped = 0
+
+    def _event_key(self, event) -> Tuple:
+        return (event.request_id, event.connection_id, event.operation_id)
+
+    def started(self, event):
+        if event.command_name in QUERY_FIELDS:
+            with self._lock:
+                self._pending[self._event_key(event)] = (event.command, current_route())
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        with self._lock:
+            pending = self._pending.pop(self._event_key(event), None)
+        duration_ms = event.duration_micros / 1000
+        if pending is None or duration_ms < self.threshold_ms:
+            return
+        command, route = pending
+        self.record(event.database_name, event.command_name, command, duration_ms, route or "background")
+
+    def record(self, database: str, command_name: str, command: dict, duration_ms: float, route: str):
+        collection = str(command.get(command_name, ""))
+        shape = query_shape(command_name, command)
+        key = (collection, command_name, shape)
+        logger.warning(f"Slow Mongo {command_name} on {collection} took {duration_ms:.0f}ms ({route}): {shape}")
+        with self._lock:
+            self.recent.append({
+                "at": datetime.now(timezone.utc).isoformat(),
+                "collection": collection,
+                "command": command_name,
+                "duration_ms": round(duration_ms, 1),
+                "route": route,
+                "shape": shape,
+            })
+            entry = self.shapes.get(key)
+            if entry is None:
+                if len(self.shapes) >= MAX_SHAPES:
+                    self.dropped += 1
+                    return
+                entry = self.shapes[key] = {
+                    "collection": collection,
+                    "command": command_name,
+                    "shape": shape,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "routes": [],
+                    "collscan": None,  # unknown until explained
+                }
+                if self.explain:
+                    explain_command = {k: v for k, v in command.items() if k not in COMMAND_META_FIELDS}
+                    self._to_explain.append((key, database, explain_command))
+            entry["count"] += 1
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            if route not in entry["routes"]:
+                entry["routes"].append(route)
+
+    async def explain_pending(self, client):
+        """Explain queued shapes (queryPlanner only, nothing is executed)"""
+        while self._to_explain:
+            key, database, command = self._to_explain.popleft()
+            try:
+                result = await client[database].command({"explain": command, "verbosity": "queryPlanner"})
+            except Exception as e:
+                logger.error(f"Explain failed for {key[1]} on {key[0]}: {e}")
+                continue
+            collscan = find_collscan(result)
+            with self._lock:
+                if key in self.shapes:
+                    self.shapes[key]["collscan"] = collscan
+            if collscan:
+                logger.warning(f"COLLSCAN: {key[1]} on {key[0]} {key[2]}")
+
+    async def run_explainer(self, client):
+        """Background task explaining new slow shapes (runs for the app lifetime)"""
+        while True:
+            await asyncio.sleep(EXPLAIN_INTERVAL_SECONDS)
+            try:
+                await self.explain_pending(client)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Slow query explainer error: {e}")
+
+    def report(self) -> dict:
+        with self._lock:
+            shapes = sorted(
+                ({**entry, "avg_ms": round(entry["total_ms"] / entry["count"], 1), "total_ms": round(entry["total_ms"], 1),
+                  "max_ms": round(entry["max_ms"], 1), "routes": list(entry["routes"])}
+                 for entry in self.shapes.values()),
+                key=lambda entry: entry["total_ms"], reverse=True
+            )
+            return {
+                "threshold_ms": self.threshold_ms,
+                "explain": self.explain,
+                "shapes": shapes,
+                "recent": list(reversed(self.recent)),
+                "dropped_shapes": self.dropped,
+            }
+
+    def clear(self):
+        with self._lock:
+            self.shapes.clear()
+            self.recent.clear()
+            self._to_explain.clear()
+            self.dropped = 0
+
+slow_query_log = SlowQueryLog()
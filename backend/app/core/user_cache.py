@@ -0,0 +1,58 @@
+import asyncio
+import time
+from typing import Optional
+from .database import redis_client
+from .logging import logger
+from .ttl_cache import TTLCache
+from ..models.user import User
+
+# Resolved bearer tokens, so authenticated requests skip the users lookup.
+# Entries live at most USER_CACHE_TTL_SECONDS (and never past the token's exp);
+# users.py publishes on USER_INVALIDATION_CHANNEL when a user changes, which drops
+# that user's entries on every worker.
+USER_CACHE_TTL_SECONDS = 60
+USER_CACHE_MAX_SIZE = 1024
+USER_INVALIDATION_CHANNEL = "auth:user_invalidations"
+LISTENER_RETRY_SECONDS = 2
+
+class UserCache(TTLCache):
+    def __init__(self, max_size: int = USER_CACHE_MAX_SIZE, ttl: float = USER_CACHE_TTL_SECONDS):
+        super().__init__(max_size, ttl)
+
+    def put(self, token: str, user: User, token_exp: Optional[float] = None):
+        super().put(token, user, None if token_exp is None else token_exp - time.time())
+
+    def invalidate_user(self, user_id: str):
+        for token, user in self.items():
+            if user.id == user_id:
+                self.pop(token)
+
+user_cache = UserCache()
+
+async def publish_user_change(user_id: str, redis):
+    """Drop a user's cached tokens here and on every other worker"""
+    user_cache.invalidate_user(user_id)
+    try:
+        await redis.publish(USER_INVALIDATION_CHANNEL, user_id)
+    except Exception as e:
+        logger.error(f"Failed to publish user invalidation for {user_id}: {e}")
+
+async def run_invalidation_listener():
+    """Apply user invalidations from other workers (runs for the app lifetime)"""
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(USER_INVALIDATION_CHANNEL)
+            # Invalidations may have been missed while disconnected
+            user_cache.clear()
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    user_cache.invalidate_user(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"User invalidation listener error: {e}")
+            user_cache.clear()
+            await asyncio.sleep(LISTENER_RETRY_SECONDS)
+        finally:
+            await pubsub.aclose()
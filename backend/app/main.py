@@ -1,26 +1,44 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Depends
+import asyncio
 from starlette.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
 from .core.config import settings
 from .core.logging import logger
-from .routers import auth, users, tickets, stats, webhook, notifications, performance, export, uploads
-
-# Rate limiter setup
-limiter = Limiter(key_func=get_remote_address)
+from .core.database import ensure_indexes, client
+from .core.slow_queries import slow_query_log
+from .core.user_cache import run_invalidation_listener
+from .core.api_keys import load_service_keys
+from .core.admission import AdmissionControlMiddleware
+from .core.metrics import RouteTimer
+from .core.rate_limit import analytics_rate_limit, STATISTICS_COST, PERFORMANCE_COST, EXPORT_COST
+from .routers import auth, users, tickets, stats, webhook, notifications, performance, export, uploads, assignment, metrics, diagnostics
 
 app = FastAPI(title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json")
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 @app.on_event("startup")
 async def startup_event():
     logger.info("Application startup")
+    load_service_keys()
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        logger.error(f"Failed to ensure indexes: {e}")
+    app.state.notification_backplane = asyncio.create_task(notifications.run_backplane())
+    app.state.user_invalidation_listener = asyncio.create_task(run_invalidation_listener())
+    app.state.slow_query_explainer = asyncio.create_task(slow_query_log.run_explainer(client)) if slow_query_log.explain else None
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Application shutdown")
+    app.state.notification_backplane.cancel()
+    app.state.user_invalidation_listener.cancel()
+    if app.state.slow_query_explainer:
+        app.state.slow_query_explainer.cancel()
+
+# Load shedding for analytics routes (added first so CORS headers still wrap its 503s)
+app.add_middleware(AdmissionControlMiddleware)
+
+# Wraps admission control, so route latency includes time spent queued there
+app.add_middleware(RouteTimer)
 
 # CORS
 app.add_middleware(
@@ -34,12 +52,15 @@ app.add_middleware(
 app.include_router(auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["auth"])
 app.include_router(users.router, prefix=f"{settings.API_V1_STR}/users", tags=["users"])
 app.include_router(tickets.router, prefix=f"{settings.API_V1_STR}/tickets", tags=["tickets"])
-app.include_router(stats.router, prefix=f"{settings.API_V1_STR}/statistics", tags=["stats"])
-app.include_router(performance.router, prefix=f"{settings.API_V1_STR}/performance", tags=["performance"])
-app.include_router(export.router, prefix=f"{settings.API_V1_STR}/export", tags=["export"])
+app.include_router(stats.router, prefix=f"{settings.API_V1_STR}/statistics", tags=["stats"], dependencies=[Depends(analytics_rate_limit(STATISTICS_COST))])
+app.include_router(performance.router, prefix=f"{settings.API_V1_STR}/performance", tags=["performance"], dependencies=[Depends(analytics_rate_limit(PERFORMANCE_COST))])
+app.include_router(export.router, prefix=f"{settings.API_V1_STR}/export", tags=["export"], dependencies=[Depends(analytics_rate_limit(EXPORT_COST))])
 app.include_router(webhook.router, prefix=f"{settings.API_V1_STR}/webhook", tags=["webhook"])
 app.include_router(uploads.router, prefix=f"{settings.API_V1_STR}/uploads", tags=["uploads"])
+app.include_router(assignment.router, prefix=f"{settings.API_V1_STR}/assignment", tags=["assignment"])
 app.include_router(notifications.router, prefix=f"{settings.API_V1_STR}/notifications", tags=["notifications"])
+app.include_router(metrics.router, tags=["metrics"])
+app.include_router(diagnostics.router, prefix=f"{settings.API_V1_STR}/diagnostics", tags=["diagnostics"])
 
 @app.get("/")
 async def root():
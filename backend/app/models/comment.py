@@ -31,3 +31,7 @@ class Comment(BaseModel):
     sent_to_telegram: bool = False
     read_by_agent: bool = False
 
+
+class TelegramDeliveryAck(BaseModel):
+    comment_ids: List[str]
+    stream_ids: List[str] = []  # Outbox entries to acknowledge, as returned by the outbox read
@@ -41,6 +41,7 @@ class TicketUpdate(BaseModel):
     status: Optional[str] = None
     assigned_agent: Optional[str] = None
     assigned_agent_name: Optional[str] = None
+    expected_version: Optional[int] = None  # Reject with 409 if the ticket changed since this version
 
 class Ticket(TicketCreate):
     model_config = ConfigDict(extra="ignore")
@@ -51,3 +52,8 @@ class Ticket(TicketCreate):
     completed_at: Optional[datetime] = None
     assigned_agent: Optional[str] = None
     assigned_agent_name: Optional[str] = None
+    version: int = 0
+    # Unread user replies since an agent last opened the ticket (badge state)
+    unread_user_replies: int = 0
+    last_user_reply_at: Optional[datetime] = None
+    last_read_at: Optional[datetime] = None
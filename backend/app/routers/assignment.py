@@ -0,0 +1,34 @@
+from fastapi import APIRouter, HTTPException, Depends
+from ..core.config import settings
+from ..core.database import get_db, get_redis
+from ..core.deps import get_current_user, is_admin_role
+from ..models.user import User
+from ..services import assignment
+
+router = APIRouter()
+
+@router.post("/online")
+async def go_online(current_user: User = Depends(get_current_user), db = Depends(get_db), redis = Depends(get_redis)):
+    """Rejoin the auto-assignment pool (e.g. after /offline); agents also join automatically
+    when their notifications WebSocket connects. Queued tickets are handed out immediately."""
+    if current_user.role != "agent":
+        raise HTTPException(status_code=403, detail="Hak akses agent diperlukan")
+    
+    active = await assignment.go_online(current_user, db, redis)
+    return {"status": "online", "active_tickets": active, "max_tickets": settings.MAX_TICKETS_PER_AGENT}
+
+@router.post("/offline")
+async def go_offline(current_user: User = Depends(get_current_user), redis = Depends(get_redis)):
+    """Leave the auto-assignment pool until the next /online or WebSocket session; current tickets stay assigned"""
+    if current_user.role != "agent":
+        raise HTTPException(status_code=403, detail="Hak akses agent diperlukan")
+    
+    await assignment.go_offline(current_user.id, redis)
+    return {"status": "offline"}
+
+@router.get("/workload")
+async def get_workload(current_user: User = Depends(get_current_user), redis = Depends(get_redis)):
+    if not is_admin_role(current_user.role):
+        raise HTTPException(status_code=403, detail="Hak akses admin diperlukan")
+    
+    return await assignment.get_workload(redis)
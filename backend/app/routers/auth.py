@@ -1,20 +1,17 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Request
+from fastapi import APIRouter, HTTPException, status, Depends
 from datetime import timedelta
-from slowapi import Limiter
-from slowapi.util import get_remote_address
 import re
 from ..core.security import create_access_token, get_password_hash, verify_password
 from ..core.config import settings
 from ..core.database import get_db
 from ..models.user import User, UserCreate, UserLogin
 from ..core.logging import logger
+from ..core.rate_limit import ip_rate_limit
 
 router = APIRouter()
-limiter = Limiter(key_func=get_remote_address)
 
-@router.post("/register", response_model=User)
-@limiter.limit("3/minute")  # Prevent spam registration
-async def register(request: Request, user_data: UserCreate, db = Depends(get_db)):
+@router.post("/register", response_model=User, dependencies=[Depends(ip_rate_limit("auth:register", 3))])  # Prevent spam registration
+async def register(user_data: UserCreate, db = Depends(get_db)):
     # Validate username - only alphanumeric and underscore
     if not re.match(r'^[a-zA-Z0-9_]+$', user_data.username):
         raise HTTPException(status_code=400, detail="Username hanya boleh huruf, angka, dan underscore (_)")
@@ -25,7 +22,7 @@ async def register(request: Request, user_data: UserCreate, db = Depends(get_db)
         raise HTTPException(status_code=400, detail="Username sudah terdaftar")
     
     # Create user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash(user_data.password)
     user = User(
         username=user_data.username,
         full_name=user_data.full_name,
@@ -40,13 +37,12 @@ async def register(request: Request, user_data: UserCreate, db = Depends(get_db)
     await db.users.insert_one(user_dict)
     return user
 
-@router.post("/login")
-@limiter.limit("5/minute")  # Prevent brute force attacks
-async def login(request: Request, form_data: UserLogin, db = Depends(get_db)):
+@router.post("/login", dependencies=[Depends(ip_rate_limit("auth:login", 5))])  # Prevent brute force attacks
+async def login(form_data: UserLogin, db = Depends(get_db)):
     logger.info(f"Login attempt for user: {form_data.username}")
     user = await db.users.find_one({"username": form_data.username})
 
-    if not user or not verify_password(form_data.password, user['password_hash']):
+    if not user or not await verify_password(form_data.password, user['password_hash']):
         logger.warning(f"Failed login attempt for user: {form_data.username}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
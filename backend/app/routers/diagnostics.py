@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends, HTTPException
+from ..core.deps import get_current_user, is_admin_role
+from ..core.slow_queries import slow_query_log
+from ..models.user import User
+
+router = APIRouter()
+
+def _require_admin(current_user: User):
+    if not is_admin_role(current_user.role):
+        raise HTTPException(status_code=403, detail="Hak akses admin diperlukan")
+
+@router.get("/slow-queries")
+async def get_slow_queries(current_user: User = Depends(get_current_user)):
+    """Slow Mongo query shapes on this worker, most total time first"""
+    _require_admin(current_user)
+    return slow_query_log.report()
+
+@router.delete("/slow-queries")
+async def clear_slow_queries(current_user: User = Depends(get_current_user)):
+    _require_admin(current_user)
+    slow_query_log.clear()
+    return {"message": "Log query lambat dikosongkan"}
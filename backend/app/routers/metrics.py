@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from ..core.admission import endpoint_classes
+from ..core.deps import get_current_user, is_admin_role
+from ..core.metrics import GaugeFunc, render_metrics
+from ..core.security import hash_stats
+from ..models.user import User
+from .notifications import manager
+
+router = APIRouter()
+
+# State owned by other modules, read at scrape time
+GaugeFunc("websocket_connections", "Open notification WebSockets", [],
+          lambda: {(): len(manager.active_connections)})
+GaugeFunc("websocket_users", "Users with at least one open notification WebSocket", [],
+          lambda: {(): len(manager.user_connections)})
+GaugeFunc("admission_requests", "Admission-controlled requests by endpoint class and state", ["endpoint_class", "state"],
+          lambda: {
+              (cls.name, state): cls.snapshot()[state]
+              for cls in endpoint_classes
+              for state in ("in_flight", "waiting", "admitted", "rejected")
+          })
+GaugeFunc("password_hash_calls", "bcrypt pool calls by state", ["state"],
+          lambda: {(state,): getattr(hash_stats, state) for state in ("in_flight", "completed", "rejected")})
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics(current_user: User = Depends(get_current_user)):
+    """Prometheus text exposition; scrape with an admin service API key (X-API-Key)"""
+    if not is_admin_role(current_user.role):
+        raise HTTPException(status_code=403, detail="Hak akses admin diperlukan")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,103 +1,391 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from typing import List
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Request, Header, Depends
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
 import json
+import time
 import asyncio
-from ..core.deps import get_current_user
+from ..core.database import db, redis_client, get_db, get_redis
+from ..core.deps import get_user_from_token, is_admin_role
 from ..core.logging import logger
+from ..models.user import User
+from ..services import assignment, presence
 
 router = APIRouter()
 
+# Max messages buffered per socket before it is treated as a slow consumer
+SEND_QUEUE_SIZE = 100
+
+# Redis channel shared by all workers so every process can reach its own sockets
+NOTIFICATION_CHANNEL = "notifications:events"
+BACKPLANE_RETRY_SECONDS = 2
+
+# Capped Redis stream of recent events, replayed to SSE clients from Last-Event-ID
+EVENT_STREAM_KEY = "notifications:stream"
+EVENT_STREAM_MAXLEN = 1000
+SSE_BLOCK_MS = 15000
+SSE_READ_COUNT = 100
+
+# Topics: every event is routed only to sockets subscribed to one of its topics
+ADMINS_TOPIC = "admins"
+AGENTS_TOPIC = "agents"
+MAX_TICKET_SUBSCRIPTIONS = 20
+
+# Pings refresh presence at most this often per socket
+HEARTBEAT_MIN_INTERVAL_SECONDS = 10
+
+def user_topic(user_id: str) -> str:
+    return f"user:{user_id}"
+
+def ticket_topic(ticket_id: str) -> str:
+    return f"ticket:{ticket_id}"
+
+def default_topics(user: User) -> Set[str]:
+    """Topics a socket joins on connect, based on the authenticated user's role"""
+    topics = {user_topic(user.id)}
+    if is_admin_role(user.role):
+        topics.add(ADMINS_TOPIC)
+    elif user.role == "agent":
+        topics.add(AGENTS_TOPIC)
+    return topics
+
+class ClientConnection:
+    """A connected socket with its own bounded outgoing queue and writer task"""
+    def __init__(self, websocket: WebSocket, user_id: str):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.topics: Set[str] = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.writer_task: Optional[asyncio.Task] = None
+        self.last_heartbeat = 0.0
+
+    def enqueue(self, payload: str) -> bool:
+        """Queue a pre-serialized payload without blocking. Returns False if the queue is full."""
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            return False
+
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.user_connections: dict = {}  # {user_id: websocket}
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        self.user_connections: Dict[str, Set[ClientConnection]] = {}  # {user_id: {connection, ...}}
+        self.topic_connections: Dict[str, Set[ClientConnection]] = {}  # {topic: {connection, ...}}
 
-    async def connect(self, websocket: WebSocket, user_id: str):
+    async def connect(self, websocket: WebSocket, user_id: str, topics: Iterable[str] = ()) -> ClientConnection:
         await websocket.accept()
-        self.active_connections.append(websocket)
-        self.user_connections[user_id] = websocket
+        conn = ClientConnection(websocket, user_id)
+        conn.writer_task = asyncio.create_task(self._writer(conn))
+        self.active_connections[websocket] = conn
+        self.user_connections.setdefault(user_id, set()).add(conn)
+        for topic in topics:
+            self.subscribe(conn, topic)
         logger.info(f"WebSocket connected: user {user_id}")
+        return conn
+
+    def disconnect(self, websocket: WebSocket):
+        conn = self.active_connections.pop(websocket, None)
+        if not conn:
+            return
+        for topic in list(conn.topics):
+            self.unsubscribe(conn, topic)
+        user_conns = self.user_connections.get(conn.user_id)
+        if user_conns is not None:
+            user_conns.discard(conn)
+            if not user_conns:
+                del self.user_connections[conn.user_id]
+        if conn.writer_task and conn.writer_task is not asyncio.current_task():
+            conn.writer_task.cancel()
+        logger.info(f"WebSocket disconnected: user {conn.user_id}")
+
+    def subscribe(self, conn: ClientConnection, topic: str):
+        conn.topics.add(topic)
+        self.topic_connections.setdefault(topic, set()).add(conn)
+
+    def unsubscribe(self, conn: ClientConnection, topic: str):
+        conn.topics.discard(topic)
+        subscribers = self.topic_connections.get(topic)
+        if subscribers is not None:
+            subscribers.discard(conn)
+            if not subscribers:
+                del self.topic_connections[topic]
+
+    async def _writer(self, conn: ClientConnection):
+        """Drain one connection's queue so a stalled socket only delays itself"""
+        try:
+            while True:
+                payload = await conn.queue.get()
+                await conn.websocket.send_text(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending to {conn.user_id}: {e}")
+            self.disconnect(conn.websocket)
 
-    def disconnect(self, websocket: WebSocket, user_id: str):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        if user_id in self.user_connections:
-            del self.user_connections[user_id]
-        logger.info(f"WebSocket disconnected: user {user_id}")
+    def _evict(self, conn: ClientConnection):
+        """Drop a slow consumer whose queue overflowed"""
+        logger.warning(f"Evicting slow WebSocket consumer: user {conn.user_id}")
+        self.disconnect(conn.websocket)
+        asyncio.create_task(self._close(conn.websocket))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)  # Try again later
+        except Exception:
+            pass
+
+    def deliver(self, conn: ClientConnection, payload: str):
+        """Queue a payload for one connection, evicting it if it can't keep up"""
+        if not conn.enqueue(payload):
+            self._evict(conn)
 
     async def send_personal_message(self, message: dict, user_id: str):
-        """Send message to specific user"""
-        if user_id in self.user_connections:
-            try:
-                await self.user_connections[user_id].send_json(message)
-            except Exception as e:
-                logger.error(f"Error sending message to {user_id}: {e}")
+        """Send message to every socket of a specific user"""
+        self.send_to_topics([user_topic(user_id)], json.dumps(message))
+
+    def send_to_topics(self, topics: Iterable[str], payload: str):
+        """Queue an already serialized message once for each socket subscribed to any of the topics"""
+        recipients: Set[ClientConnection] = set()
+        for topic in topics:
+            recipients.update(self.topic_connections.get(topic, ()))
+        for conn in recipients:
+            self.deliver(conn, payload)
+
+    def broadcast_payload(self, payload: str):
+        """Queue an already serialized message for every socket on this worker"""
+        for conn in list(self.active_connections.values()):
+            self.deliver(conn, payload)
 
     async def broadcast(self, message: dict):
-        """Broadcast message to all connected clients"""
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting: {e}")
-                disconnected.append(connection)
-        
-        # Remove disconnected
-        for conn in disconnected:
-            if conn in self.active_connections:
-                self.active_connections.remove(conn)
+        """Broadcast message to all connected clients without waiting on any socket"""
+        self.broadcast_payload(json.dumps(message))  # Serialize once, shared by every recipient
 
 manager = ConnectionManager()
 
+def handle_client_message(conn: ClientConnection, data: str):
+    """Answer pings and apply per-ticket subscribe/unsubscribe requests"""
+    if data == "ping":
+        manager.deliver(conn, "pong")
+        return
+    try:
+        request = json.loads(data)
+        action = request.get("action")
+        topic = request.get("topic") or ""
+    except (ValueError, AttributeError):
+        return
+    # Clients may only manage ticket topics; role topics are fixed at connect time
+    if not topic.startswith("ticket:"):
+        return
+    if action == "subscribe":
+        ticket_topics = [t for t in conn.topics if t.startswith("ticket:")]
+        if len(ticket_topics) < MAX_TICKET_SUBSCRIPTIONS:
+            manager.subscribe(conn, topic)
+    elif action == "unsubscribe":
+        manager.unsubscribe(conn, topic)
+
+async def record_heartbeat(conn: ClientConnection, user: User):
+    """Refresh the user's presence from a socket ping, throttled per connection.
+    An agent coming online (connect, or back after a lapse) joins the auto-assignment pool."""
+    now = time.monotonic()
+    if now - conn.last_heartbeat < HEARTBEAT_MIN_INTERVAL_SECONDS:
+        return
+    conn.last_heartbeat = now
+    try:
+        was_online = await presence.heartbeat(user, redis_client)
+        if user.role == "agent" and not was_online:
+            await assignment.join_pool(user, db, redis_client)
+    except Exception as e:
+        logger.error(f"Failed to record presence for {user.id}: {e}")
+
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket, token: str = None):
     """
     WebSocket endpoint for real-time notifications
     Connect with: ws://localhost:8001/api/notifications/ws?token=YOUR_JWT_TOKEN
+    Send {"action": "subscribe", "topic": "ticket:<id>"} to follow a single ticket.
     """
-    user_id = None
     try:
-        # Simple token validation (in production, decode JWT properly)
-        # For now, we'll accept any connection and use a temp ID
-        user_id = token if token else str(id(websocket))
-        
-        await manager.connect(websocket, user_id)
-        
+        user = await get_user_from_token(token or "", db)
+    except HTTPException:
+        await websocket.close(code=1008)  # Policy violation
+        return
+
+    conn = None
+    try:
+        conn = await manager.connect(websocket, user.id, default_topics(user))
+        await record_heartbeat(conn, user)
+
         # Keep connection alive and handle incoming messages
         while True:
             try:
-                # Wait for any message from client (ping/pong)
                 data = await websocket.receive_text()
                 if data == "ping":
-                    await websocket.send_text("pong")
+                    await record_heartbeat(conn, user)
+                handle_client_message(conn, data)
             except WebSocketDisconnect:
                 break
             except Exception as e:
                 logger.error(f"WebSocket error: {e}")
                 break
-                
+
     except Exception as e:
         logger.error(f"WebSocket connection error: {e}")
     finally:
-        if user_id:
-            manager.disconnect(websocket, user_id)
+        if conn:
+            manager.disconnect(websocket)
+
+async def publish(message: dict, topics: List[str]):
+    """Publish an event for the given topics to every worker and the replay stream, falling back to local sockets if Redis is down"""
+    await publish_many([(message, topics)])
+
+async def publish_many(events: List[Tuple[dict, List[str]]]):
+    """Publish several (message, topics) events in one pipeline, see publish()"""
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for message, topics in events:
+                pipe.publish(NOTIFICATION_CHANNEL, json.dumps({"topics": topics, "message": message}))
+                pipe.xadd(
+                    EVENT_STREAM_KEY,
+                    {"topics": json.dumps(topics), "message": json.dumps(message)},
+                    maxlen=EVENT_STREAM_MAXLEN,
+                    approximate=True
+                )
+            await pipe.execute()
+    except Exception as e:
+        logger.error(f"Failed to publish notification, delivering locally: {e}")
+        for message, topics in events:
+            manager.send_to_topics(topics, json.dumps(message))
+
+def parse_stream_id(event_id: str) -> Tuple[int, int]:
+    """Split a Redis stream ID ("<ms>-<seq>") into a comparable tuple"""
+    ms, _, seq = event_id.partition("-")
+    return int(ms), int(seq or 0)
+
+def format_sse(payload: str, event_id: Optional[str] = None) -> str:
+    lines = f"id: {event_id}\n" if event_id else ""
+    return f"{lines}data: {payload}\n\n"
+
+async def sse_events(request: Request, redis, topics: Set[str], last_event_id: Optional[str]) -> AsyncIterator[str]:
+    """Yield SSE frames for events on the given topics, starting after last_event_id"""
+    if last_event_id:
+        oldest = await redis.xrange(EVENT_STREAM_KEY, count=1)
+        if oldest and parse_stream_id(last_event_id) < parse_stream_id(oldest[0][0]):
+            # Events after last_event_id may have been trimmed, the client must refetch
+            yield format_sse(json.dumps({"type": "resync"}))
+        last_id = last_event_id
+    else:
+        # Pin the current tail so events published between reads are not skipped
+        newest = await redis.xrevrange(EVENT_STREAM_KEY, count=1)
+        last_id = newest[0][0] if newest else "0-0"
+
+    while not await request.is_disconnected():
+        entries = await redis.xread({EVENT_STREAM_KEY: last_id}, count=SSE_READ_COUNT, block=SSE_BLOCK_MS)
+        if not entries:
+            yield ": keepalive\n\n"
+            continue
+        for _, events in entries:
+            for event_id, fields in events:
+                last_id = event_id
+                if topics.intersection(json.loads(fields["topics"])):
+                    yield format_sse(fields["message"], event_id)
+
+@router.get("/stream")
+async def event_stream_endpoint(
+    request: Request,
+    token: Optional[str] = None,
+    ticket_id: Optional[str] = None,
+    last_event_id: Optional[str] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    db = Depends(get_db),
+    redis = Depends(get_redis)
+):
+    """
+    Server-Sent Events alternative to the WebSocket for clients behind proxies that break it.
+    Connect with: /api/notifications/stream?token=YOUR_JWT_TOKEN[&ticket_id=...]
+    Reconnects resume from the Last-Event-ID header; a "resync" event means history was trimmed.
+    """
+    user = await get_user_from_token(token or "", db)
+
+    resume_from = last_event_id_header or last_event_id
+    if resume_from:
+        try:
+            parse_stream_id(resume_from)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID tidak valid")
+
+    topics = default_topics(user)
+    if ticket_id:
+        topics.add(ticket_topic(ticket_id))
+
+    return StreamingResponse(
+        sse_events(request, redis, topics, resume_from),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def run_backplane():
+    """Relay events from the Redis channel to this worker's sockets (runs for the app lifetime)"""
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(NOTIFICATION_CHANNEL)
+            logger.info(f"Subscribed to notification channel {NOTIFICATION_CHANNEL}")
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    event = json.loads(message["data"])
+                    manager.send_to_topics(event["topics"], json.dumps(event["message"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Notification backplane error: {e}")
+            await asyncio.sleep(BACKPLANE_RETRY_SECONDS)
+        finally:
+            await pubsub.aclose()
 
 # Helper function to notify clients (called from other routers)
 async def notify_new_ticket(ticket_data: dict):
-    """Notify all agents about new ticket"""
-    await manager.broadcast({
+    """Notify agents and admins about new ticket (any agent may claim it)"""
+    await publish({
         "type": "new_ticket",
         "data": ticket_data
-    })
+    }, [AGENTS_TOPIC, ADMINS_TOPIC])
 
-async def notify_new_reply(ticket_id: str, ticket_number: str, user_name: str):
-    """Notify agents about new user reply"""
-    await manager.broadcast({
+async def notify_new_reply(ticket_id: str, ticket_number: str, user_name: str, assigned_agent: Optional[str] = None):
+    """Notify the assigned agent, admins and viewers of the ticket about a new user reply"""
+    agent_topic = user_topic(assigned_agent) if assigned_agent else AGENTS_TOPIC
+    await publish({
         "type": "new_reply",
         "data": {
             "ticket_id": ticket_id,
             "ticket_number": ticket_number,
             "user_name": user_name
         }
-    })
+    }, [agent_topic, ADMINS_TOPIC, ticket_topic(ticket_id)])
+
+async def notify_new_comment(comment: dict):
+    """Push a new comment to everyone viewing its ticket"""
+    await publish({
+        "type": "new_comment",
+        "data": comment
+    }, [ticket_topic(comment["ticket_id"])])
+
+def _ticket_assigned_event(ticket_id: str, ticket_number: str, agent_id: str) -> Tuple[dict, List[str]]:
+    return {
+        "type": "ticket_assigned",
+        "data": {
+            "ticket_id": ticket_id,
+            "ticket_number": ticket_number,
+            "agent_id": agent_id
+        }
+    }, [user_topic(agent_id), ADMINS_TOPIC]
+
+async def notify_ticket_assigned(ticket_id: str, ticket_number: str, agent_id: str):
+    """Tell an agent (and admins) that a ticket was auto-assigned to them"""
+    await publish(*_ticket_assigned_event(ticket_id, ticket_number, agent_id))
+
+async def notify_tickets_assigned(tickets: List[dict]):
+    """notify_ticket_assigned for many tickets, published in one round trip"""
+    if tickets:
+        await publish_many([
+            _ticket_assigned_event(t['id'], t['ticket_number'], t['assigned_agent']) for t in tickets
+        ])
@@ -2,10 +2,11 @@ from fastapi import APIRouter, HTTPException, Depends, Query
 from typing import List, Optional
 from datetime import datetime, timezone
 import json
-from ..core.database import get_db
+from ..core.database import get_db, get_redis
 from ..core.deps import get_current_user, is_admin_role
 from ..models.user import User
 from ..core.logging import logger
+from ..services import data_versions
 
 router = APIRouter()
 
@@ -18,11 +19,29 @@ def parse_datetime(dt):
         dt = dt.replace(tzinfo=timezone.utc)
     return dt
 
+def filter_scope(year, month, agent_id) -> str:
+    """The narrowest data-version scope a filtered report depends on"""
+    if year and month and year.isdigit() and month.isdigit():
+        return data_versions.month_scope(int(year), int(month))
+    if agent_id and agent_id != 'all':
+        return data_versions.agent_scope(agent_id)
+    return data_versions.GLOBAL_SCOPE
+
+async def get_cached_report(redis, name, year, month, category, agent_id):
+    """(cache key, cached report or None) for a filtered report"""
+    key = await data_versions.cache_key(
+        redis, f"performance:{name}", [filter_scope(year, month, agent_id)],
+        year=year, month=month, category=category, agent_id=agent_id
+    )
+    cached = await redis.get(key)
+    return key, json.loads(cached) if cached else None
+
 def filter_tickets(tickets, year, month, category, agent_id):
     filtered = []
     for t in tickets:
         dt = parse_datetime(t.get('created_at'))
         if not dt: continue
+        dt = dt.astimezone(timezone.utc)  # Same calendar month as data_versions.ticket_scopes
         
         if year and year != 'all' and str(dt.year) != str(year): continue
         if month and month != 'all' and str(dt.month) != str(month): continue
@@ -39,11 +58,16 @@ async def get_performance_table_data(
     category: Optional[str] = None,
     agent_id: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db = Depends(get_db)
+    db = Depends(get_db),
+    redis = Depends(get_redis)
 ):
     if not is_admin_role(current_user.role):
         raise HTTPException(status_code=403, detail="Admin access required")
 
+    cache_key, cached = await get_cached_report(redis, "table-data", year, month, category, agent_id)
+    if cached is not None:
+        return cached
+
     tickets = await db.tickets.find({}).to_list(10000)
     filtered_tickets = filter_tickets(tickets, year, month, category, agent_id)
     
@@ -126,7 +150,9 @@ async def get_performance_table_data(
     if summary["total"] > 0:
         summary["completion_rate"] = round((summary["completed"] / summary["total"]) * 100, 1)
         
-    return {"data": data, "summary": summary}
+    result = {"data": data, "summary": summary}
+    await redis.setex(cache_key, data_versions.CACHE_TTL_SECONDS, json.dumps(result))
+    return result
 
 @router.get("/by-agent")
 async def get_performance_by_agent(
@@ -135,10 +161,15 @@ async def get_performance_by_agent(
     category: Optional[str] = None,
     agent_id: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db = Depends(get_db)
+    db = Depends(get_db),
+    redis = Depends(get_redis)
 ):
     if not is_admin_role(current_user.role):
         raise HTTPException(status_code=403, detail="Admin access required")
+
+    cache_key, cached = await get_cached_report(redis, "by-agent", year, month, category, agent_id)
+    if cached is not None:
+        return cached
     
     # Get all tickets, not just completed ones, to show workload
     tickets = await db.tickets.find({}).to_list(10000)
@@ -184,7 +215,9 @@ async def get_performance_by_agent(
             grand_total["lepas_bi"] += 1
 
     result = list(agent_stats.values())
-    return {"data": sorted(result, key=lambda x: x['total'], reverse=True), "grand_total": grand_total}
+    report = {"data": sorted(result, key=lambda x: x['total'], reverse=True), "grand_total": grand_total}
+    await redis.setex(cache_key, data_versions.CACHE_TTL_SECONDS, json.dumps(report))
+    return report
 
 @router.get("/by-product")
 async def get_performance_by_product(
@@ -193,10 +226,15 @@ async def get_performance_by_product(
     category: Optional[str] = None,
     agent_id: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db = Depends(get_db)
+    db = Depends(get_db),
+    redis = Depends(get_redis)
 ):
     if not is_admin_role(current_user.role):
         raise HTTPException(status_code=403, detail="Admin access required")
+
+    cache_key, cached = await get_cached_report(redis, "by-product", year, month, category, agent_id)
+    if cached is not None:
+        return cached
         
     tickets = await db.tickets.find({}).to_list(10000)
     filtered_tickets = filter_tickets(tickets, year, month, category, agent_id)
@@ -261,8 +299,10 @@ async def get_performance_by_product(
         else:
             return (2, item.get('product', ''))
     
-    return {
+    report = {
         "data": sorted(result, key=sort_key), 
         "grand_total": grand_total,
         "pivoted_total": pivoted_total
     }
+    await redis.setex(cache_key, data_versions.CACHE_TTL_SECONDS, json.dumps(report))
+    return report
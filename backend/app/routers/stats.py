@@ -5,6 +5,7 @@ from ..core.database import get_db, get_redis
 from ..core.deps import get_current_user, is_admin_role
 from ..models.user import User
 from ..core.logging import logger
+from ..services import data_versions
 
 router = APIRouter()
 
@@ -22,7 +23,7 @@ async def get_admin_dashboard(current_user: User = Depends(get_current_user), db
     if not is_admin_role(current_user.role):
         raise HTTPException(status_code=403, detail="Hak akses admin diperlukan")
     
-    cache_key = "dashboard:admin:stats:v2"
+    cache_key = await data_versions.cache_key(redis, "dashboard:admin", [data_versions.GLOBAL_SCOPE])
     cached_stats = await redis.get(cache_key)
     if cached_stats:
         return json.loads(cached_stats)
@@ -92,7 +93,7 @@ async def get_admin_dashboard(current_user: User = Depends(get_current_user), db
         "total": total_stats
     }
     
-    await redis.setex(cache_key, 300, json.dumps(result))
+    await redis.setex(cache_key, data_versions.CACHE_TTL_SECONDS, json.dumps(result))
     
     return result
 
@@ -101,7 +102,7 @@ async def get_agent_dashboard(agent_id: str, current_user: User = Depends(get_cu
     if current_user.role == "agent" and current_user.id != agent_id:
         raise HTTPException(status_code=403, detail="Hak akses admin/agent diperlukan")
     
-    cache_key = f"dashboard:agent:{agent_id}:stats:v2"
+    cache_key = await data_versions.cache_key(redis, "dashboard:agent", [data_versions.agent_scope(agent_id)], agent_id=agent_id)
     cached_stats = await redis.get(cache_key)
     if cached_stats:
         return json.loads(cached_stats)
@@ -156,7 +157,7 @@ async def get_agent_dashboard(agent_id: str, current_user: User = Depends(get_cu
         "total": total_stats
     }
     
-    await redis.setex(cache_key, 300, json.dumps(result))
+    await redis.setex(cache_key, data_versions.CACHE_TTL_SECONDS, json.dumps(result))
     
     return result
 
@@ -1,47 +1,66 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Header, status
+from pymongo.errors import DuplicateKeyError
 from typing import List, Optional
 from datetime import datetime, timezone
 import logging
 import asyncio
 import json
 import uuid
-import random
-import string
 
 from ..core.database import get_db, get_redis
 from ..core.config import settings
 from ..core.deps import get_current_user, is_admin_role
 from ..models.user import User
 from ..models.ticket import Ticket, TicketCreate, TicketUpdate
-from ..models.comment import Comment, CommentCreate, CommentCreateBot
-from ..services.telegram import send_telegram_message, send_telegram_photo
+from ..models.comment import Comment, CommentCreate, CommentCreateBot, TelegramDeliveryAck
+from ..services.telegram import send_telegram_message, send_telegram_photo, notify_ticket_claimed
+from ..services import assignment, data_versions, telegram_outbox, ticket_facets
+from ..services.idempotency import IdempotencyGuard
+from ..services.ticket_numbers import next_ticket_number
+from ..services.two_tier_cache import reference_cache, TICKET_YEARS_KEY, TICKET_CATEGORIES_KEY
 from ..core.logging import logger
 from . import notifications
 
 router = APIRouter()
 
+ACTIVE_TICKET_STATUSES = ["open", "in_progress", "pending"]
+
 @router.post("/", response_model=Ticket)
-async def create_ticket(ticket_data: TicketCreate, current_user: User = Depends(get_current_user), db = Depends(get_db), redis = Depends(get_redis)):
-    # Generate ticket number if not provided
-    ticket_dict = ticket_data.model_dump()
-    if not ticket_dict.get('ticket_number'):
-        now = datetime.now()
-        date_str = now.strftime("%m%d%Y%H%M%S")
-        random_str = ''.join(random.choices(string.ascii_uppercase + string.digits, k=3))
-        ticket_dict['ticket_number'] = f"INC{date_str}{random_str}"
-        logger.info(f"Auto-generated ticket number: {ticket_dict['ticket_number']}")
-    
-    ticket = Ticket(**ticket_dict)
-    
-    ticket_dict = ticket.model_dump()
-    ticket_dict['created_at'] = ticket_dict['created_at'].isoformat()
-    
-    await db.tickets.insert_one(ticket_dict)
-    
-    # Invalidate cache
-    await redis.delete("dashboard:admin:stats:v2")
-    
-    return ticket
+async def create_ticket(
+    ticket_data: TicketCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: User = Depends(get_current_user),
+    db = Depends(get_db),
+    redis = Depends(get_redis)
+):
+    async with IdempotencyGuard(f"tickets:{current_user.id}", idempotency_key, redis) as guard:
+        if guard.replay is not None:
+            return guard.replay
+        
+        # Generate ticket number if not provided
+        ticket_dict = ticket_data.model_dump()
+        if not ticket_dict.get('ticket_number'):
+            ticket_dict['ticket_number'] = await next_ticket_number(db)
+            logger.info(f"Auto-generated ticket number: {ticket_dict['ticket_number']}")
+        
+        ticket = Ticket(**ticket_dict)
+        
+        ticket_dict = ticket.model_dump()
+        ticket_dict['created_at'] = ticket_dict['created_at'].isoformat()
+        
+        try:
+            await db.tickets.insert_one(ticket_dict)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=409, detail="Nomor tiket sudah digunakan")
+        
+        await data_versions.bump(redis, data_versions.ticket_scopes(ticket_dict))
+        await ticket_facets.record_created([ticket_dict], redis)
+        
+        if not ticket.assigned_agent:
+            await assignment.assign_new_ticket(ticket.id, db, redis)
+        
+        guard.response = ticket.model_dump(mode="json")
+        return ticket
 
 @router.get("/", response_model=List[Ticket])
 async def get_tickets(
@@ -98,35 +117,53 @@ async def get_available_tickets(current_user: User = Depends(get_current_user),
     return [Ticket(**t) for t in tickets]
 
 @router.get("/years")
-async def get_ticket_years(current_user: User = Depends(get_current_user), db = Depends(get_db)):
-    pipeline = [
-        {"$match": {"created_at": {"$exists": True}}},
-        {"$project": {"year": {"$toInt": {"$substr": ["$created_at", 0, 4]}}}},
-        {"$group": {"_id": "$year"}},
-        {"$sort": {"_id": -1}}
-    ]
-    years = await db.tickets.aggregate(pipeline).to_list(None)
-    return {"years": [y["_id"] for y in years if y["_id"] is not None]}
+async def get_ticket_years(current_user: User = Depends(get_current_user), db = Depends(get_db), redis = Depends(get_redis)):
+    async def load():
+        return await ticket_facets.get_years(db, redis)
+    
+    return {"years": await reference_cache.get_or_load(TICKET_YEARS_KEY, load, redis)}
 
 @router.get("/categories")
-async def get_ticket_categories(current_user: User = Depends(get_current_user), db = Depends(get_db)):
-    categories = await db.tickets.distinct("category")
-    return {"categories": sorted([c for c in categories if c])}
+async def get_ticket_categories(current_user: User = Depends(get_current_user), db = Depends(get_db), redis = Depends(get_redis)):
+    async def load():
+        return await ticket_facets.get_categories(db, redis)
+    
+    return {"categories": await reference_cache.get_or_load(TICKET_CATEGORIES_KEY, load, redis)}
 
 @router.get("/unread-replies")
 async def get_unread_replies(current_user: User = Depends(get_current_user), db = Depends(get_db)):
     """Get list of ticket IDs with unread user comments (for badge display)"""
     logger.info(f"get_unread_replies called by {current_user.username}")
-    # Find all comments from users that haven't been read by agents
-    unread_comments = await db.comments.find(
-        {"role": "user", "read_by_agent": False},
-        {"_id": 0, "ticket_id": 1}
+    # Counters are kept on the ticket by add_bot_comment / mark_ticket_read
+    tickets = await db.tickets.find(
+        {"unread_user_replies": {"$gt": 0}},
+        {"_id": 0, "id": 1}
     ).to_list(1000)
     
-    # Extract unique ticket IDs
-    ticket_ids = list(set(comment['ticket_id'] for comment in unread_comments))
-    
-    return {"ticket_ids": ticket_ids}
+    return {"ticket_ids": [t['id'] for t in tickets]}
+
+@router.get("/telegram-user/{user_telegram_id}")
+async def get_telegram_user_tickets(
+    user_telegram_id: str,
+    completed_limit: int = 0,
+    current_user: User = Depends(get_current_user),
+    db = Depends(get_db)
+):
+    """Active tickets (and optionally the latest completed ones) of a Telegram user, for the bot"""
+    projection = {"_id": 0, "id": 1, "ticket_number": 1, "status": 1, "created_at": 1}
+    active = await db.tickets.find(
+        {"user_telegram_id": user_telegram_id, "status": {"$in": ACTIVE_TICKET_STATUSES}},
+        projection
+    ).sort("created_at", -1).to_list(1000)
+    
+    completed = []
+    if completed_limit > 0:
+        completed = await db.tickets.find(
+            {"user_telegram_id": user_telegram_id, "status": "completed"},
+            projection
+        ).sort("created_at", -1).limit(min(completed_limit, 100)).to_list(None)
+    
+    return {"active": active, "active_count": len(active), "completed": completed}
 
 @router.get("/{ticket_id}", response_model=Ticket)
 async def get_ticket(ticket_id: str, current_user: User = Depends(get_current_user), db = Depends(get_db)):
@@ -151,15 +188,7 @@ async def update_ticket(
     db = Depends(get_db),
     redis = Depends(get_redis)
 ):
-    ticket = await db.tickets.find_one({"id": ticket_id})
-    if not ticket:
-        raise HTTPException(status_code=404, detail="Ticket tidak ditemukan")
-    
-    if update_data.assigned_agent and ticket.get('assigned_agent') and ticket.get('assigned_agent') != update_data.assigned_agent:
-        agent_name = ticket.get('assigned_agent_name', 'another agent')
-        raise HTTPException(status_code=409, detail=f"Tiket sudah diambil oleh {agent_name}")
-        
-    update_dict = update_data.model_dump(exclude_unset=True)
+    update_dict = update_data.model_dump(exclude_unset=True, exclude={'expected_version'})
     update_dict['updated_at'] = datetime.now(timezone.utc)
     
     if update_data.status == 'completed':
@@ -169,6 +198,36 @@ async def update_ticket(
         update_dict['assigned_agent_name'] = None
         update_dict['status'] = 'open'
     
+    # Preconditions live in the filter so check-and-write is one atomic round trip
+    query = {"id": ticket_id}
+    if update_data.assigned_agent:
+        # Claimable only while unassigned (or already ours)
+        query['assigned_agent'] = {"$in": [None, update_data.assigned_agent]}
+    if update_data.expected_version is not None:
+        # Tickets created before versioning have no field, which counts as version 0
+        query['version'] = {"$in": [0, None]} if update_data.expected_version == 0 else update_data.expected_version
+
+    logger.info(f"Updating ticket {ticket_id} with data: {update_dict}")
+    logger.info(f"Current User ID: {current_user.id}")
+
+    # Returns the pre-image: needed to detect transitions, the new state is derived from it
+    ticket = await db.tickets.find_one_and_update(
+        query,
+        {"$set": update_dict, "$inc": {"version": 1}},
+        projection={"_id": 0}
+    )
+    
+    if not ticket:
+        current = await db.tickets.find_one({"id": ticket_id}, {"_id": 0, "assigned_agent_name": 1, "assigned_agent": 1})
+        if not current:
+            raise HTTPException(status_code=404, detail="Ticket tidak ditemukan")
+        if update_data.assigned_agent and current.get('assigned_agent') not in (None, update_data.assigned_agent):
+            agent_name = current.get('assigned_agent_name', 'another agent')
+            raise HTTPException(status_code=409, detail=f"Tiket sudah diambil oleh {agent_name}")
+        raise HTTPException(status_code=409, detail="Tiket telah diubah oleh pengguna lain, silakan muat ulang")
+    
+    updated_ticket = {**ticket, **update_dict, 'version': ticket.get('version', 0) + 1}
+    
     is_new_assignment = (
         update_data.assigned_agent and 
         update_data.assigned_agent != ticket.get('assigned_agent')
@@ -178,50 +237,17 @@ async def update_ticket(
         update_data.status == 'completed' and
         ticket.get('status') != 'completed'
     )
-
-    logger.info(f"Updating ticket {ticket_id} with data: {update_dict}")
-    logger.info(f"Current User ID: {current_user.id}")
-
-    result = await db.tickets.update_one(
-        {"id": ticket_id},
-        {"$set": update_dict}
-    )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Gagal memperbarui tiket")
-        
-    updated_ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0})
     
     if is_new_assignment:
         logger.info(f"New assignment detected for ticket {ticket_id}. User ID: {updated_ticket.get('user_telegram_id')}")
-        agent_name = updated_ticket.get('assigned_agent_name', 'Agent')
-        ticket_number = updated_ticket.get('ticket_number', 'Unknown')
-        user_name = updated_ticket.get('user_telegram_name', 'User')
-        
-        # Send notification to user (WITHOUT reply button)
-        if updated_ticket.get('user_telegram_id'):
-            logger.info(f"Sending claim notification to user: {updated_ticket.get('user_telegram_id')}")
-            message = (
-                f"Halo *{user_name}*,\n\n"
-                f"Tiket Anda *{ticket_number}* telah diambil oleh *{agent_name}*.\n"
-                f"Mohon tunggu, kami sedang memprosesnya. 👨‍💻"
-            )
-            asyncio.create_task(send_telegram_message(updated_ticket.get('user_telegram_id'), message))  # No ticket_id = no reply button
-            logger.info(f"User notification task created for {updated_ticket.get('user_telegram_id')}")
-        else:
-            logger.warning(f"User Telegram ID tidak ditemukan untuk tiket {ticket_id}, skipping user notification")
-        
-        # Send notification to group
-        if settings.GROUP_CHAT_ID:
-            group_message = (
-                f"📌 *Tiket Diambil*\n\n"
-                f"Tiket *{ticket_number}* telah diambil oleh *{agent_name}*.\n"
-                f"User: {user_name}\n"
-                f"Kategori: {updated_ticket.get('category', '-')}"
-            )
-            asyncio.create_task(send_telegram_message(settings.GROUP_CHAT_ID, group_message))
-        else:
-            logger.warning(f"GROUP_CHAT_ID tidak ditemukan, skipping group notification")
+        asyncio.create_task(notify_ticket_claimed(updated_ticket))
+        await assignment.record_manual_assignment(ticket_id, update_data.assigned_agent, ticket.get('assigned_agent'), db, redis)
+    elif 'assigned_agent' in update_dict and update_dict['assigned_agent'] is None and ticket.get('assigned_agent'):
+        # Unassigned: free the agent's slot and offer the ticket to anyone but that agent
+        await assignment.release_slot(ticket['assigned_agent'], db, redis)
+        if await assignment.assign_new_ticket(ticket_id, db, redis, exclude_agent=ticket['assigned_agent']):
+            # Auto-assigned to another agent; respond with what is now stored
+            updated_ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0}) or updated_ticket
             
     if is_completed:
         logger.info(f"Ticket {ticket_id} completed. Sending notification to User ID: {updated_ticket.get('user_telegram_id')}")
@@ -244,12 +270,11 @@ async def update_ticket(
                 f"silahkan diperiksa kembali ({user_name}). Jika masih ada kendala silahkan reopen tiket atau ke grup support. Terimakasih."
             )
             asyncio.create_task(send_telegram_message(settings.GROUP_CHAT_ID, group_message))
+        
+        if ticket.get('assigned_agent'):
+            await assignment.release_slot(ticket['assigned_agent'], db, redis)
     
-    await redis.delete("dashboard:admin:stats:v2")
-    if ticket.get('assigned_agent'):
-        await redis.delete(f"dashboard:agent:{ticket['assigned_agent']}:stats:v2")
-    if update_data.assigned_agent:
-        await redis.delete(f"dashboard:agent:{update_data.assigned_agent}:stats:v2")
+    await data_versions.bump(redis, data_versions.ticket_scopes(updated_ticket, ticket.get('assigned_agent')))
         
     return Ticket(**updated_ticket)
 
@@ -258,11 +283,16 @@ async def delete_ticket(ticket_id: str, current_user: User = Depends(get_current
     if not is_admin_role(current_user.role):
         raise HTTPException(status_code=403, detail="Hak akses admin diperlukan")
         
-    result = await db.tickets.delete_one({"id": ticket_id})
-    if result.deleted_count == 0:
+    deleted = await db.tickets.find_one_and_delete(
+        {"id": ticket_id},
+        projection={"_id": 0, "created_at": 1, "assigned_agent": 1, "category": 1}
+    )
+    if not deleted:
         raise HTTPException(status_code=404, detail="Ticket tidak ditemukan")
         
-    await redis.delete("dashboard:admin:stats:v2")
+    await data_versions.bump(redis, data_versions.ticket_scopes(deleted))
+    await ticket_facets.record_deleted(deleted, redis)
+    await assignment.forget_ticket(ticket_id, redis)
         
     return {"message": "Ticket deleted"}
 
@@ -271,7 +301,8 @@ async def add_comment(
     ticket_id: str,
     comment_data: CommentCreate,
     current_user: User = Depends(get_current_user),
-    db = Depends(get_db)
+    db = Depends(get_db),
+    redis = Depends(get_redis)
 ):
     ticket = await db.tickets.find_one({"id": ticket_id})
     if not ticket:
@@ -298,6 +329,18 @@ async def add_comment(
     
     await db.comments.insert_one(comment_dict)
     
+    if settings.TELEGRAM_OUTBOX_ENABLED:
+        try:
+            await telegram_outbox.enqueue(comment.id, redis)
+        except Exception as e:
+            # Still picked up by /comments/pending-telegram
+            logger.error(f"Failed to enqueue comment {comment.id} for Telegram: {e}")
+    
+    try:
+        await notifications.notify_new_comment(comment.model_dump(mode="json"))
+    except Exception as e:
+        logger.error(f"Failed to send WebSocket notification: {e}")
+    
     logger.info(f"Comment added by {current_user.username} ({display_name}) on ticket {ticket['ticket_number']}, sending notification")
     
     # Send notification to user if comment is from agent
@@ -376,22 +419,45 @@ async def add_bot_comment(
     comment_dict['timestamp'] = comment_dict['timestamp'].isoformat()
     
     await db.comments.insert_one(comment_dict)
+    await db.tickets.update_one(
+        {"id": ticket['id']},
+        {"$inc": {"unread_user_replies": 1}, "$set": {"last_user_reply_at": comment.timestamp}}
+    )
     
     # Notify agents via WebSocket about new user reply
     try:
         await notifications.notify_new_reply(
             ticket_id=ticket['id'],
             ticket_number=ticket['ticket_number'],
-            user_name=comment_data.user_telegram_name
+            user_name=comment_data.user_telegram_name,
+            assigned_agent=ticket.get('assigned_agent')
         )
+        await notifications.notify_new_comment(comment.model_dump(mode="json"))
     except Exception as e:
         logger.error(f"Failed to send WebSocket notification: {e}")
     
     return comment
 
 @router.get("/{ticket_id}/comments", response_model=List[Comment])
-async def get_comments(ticket_id: str, current_user: User = Depends(get_current_user), db = Depends(get_db)):
-    comments = await db.comments.find({"ticket_id": ticket_id}, {"_id": 0}).to_list(1000)
+async def get_comments(
+    ticket_id: str,
+    since: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db = Depends(get_db)
+):
+    """List comments of a ticket. Pass `since` (timestamp of the last comment seen) to fetch only newer ones after a reconnect."""
+    query = {"ticket_id": ticket_id}
+    if since:
+        try:
+            since_dt = datetime.fromisoformat(since.replace("Z", "+00:00"))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Format 'since' tidak valid")
+        if since_dt.tzinfo is None:
+            since_dt = since_dt.replace(tzinfo=timezone.utc)
+        # Comments store timestamps as UTC isoformat strings, so normalize before comparing
+        query['timestamp'] = {'$gt': since_dt.astimezone(timezone.utc).isoformat()}
+    
+    comments = await db.comments.find(query, {"_id": 0}).sort("timestamp", 1).to_list(1000)
     
     for comment in comments:
         if isinstance(comment.get('timestamp'), str):
@@ -399,30 +465,84 @@ async def get_comments(ticket_id: str, current_user: User = Depends(get_current_
     
     return [Comment(**c) for c in comments]
 
+async def _telegram_deliveries(comment_ids: Optional[List[str]], db, limit: int = 1000) -> List[dict]:
+    """Unsent comments joined with their ticket in one aggregation"""
+    match = {"sent_to_telegram": False}
+    if comment_ids is not None:
+        match["id"] = {"$in": comment_ids}
+    pipeline = [
+        {"$match": match},
+        {"$limit": limit},
+        {"$lookup": {"from": "tickets", "localField": "ticket_id", "foreignField": "id", "as": "ticket"}},
+        {"$unwind": "$ticket"}
+    ]
+    rows = await db.comments.aggregate(pipeline).to_list(limit)
+    return [
+        {
+            "comment_id": row['id'],
+            "ticket_id": row['ticket_id'],
+            "ticket_number": row['ticket']['ticket_number'],
+            "user_telegram_id": row['ticket']['user_telegram_id'],
+            "user_telegram_name": row['ticket']['user_telegram_name'],
+            "agent_username": row['username'],
+            "comment": row['comment'],
+            "timestamp": row['timestamp']
+        }
+        for row in rows
+    ]
+
 @router.get("/comments/pending-telegram")
 async def get_pending_telegram_comments(db = Depends(get_db)):
-    comments = await db.comments.find(
-        {"sent_to_telegram": False},
-        {"_id": 0}
-    ).to_list(1000)
-    
-    result = []
-    for comment in comments:
-        ticket = await db.tickets.find_one({"id": comment['ticket_id']}, {"_id": 0})
-        if ticket:
-            result.append({
-                "comment_id": comment['id'],
-                "ticket_id": comment['ticket_id'],
-                "ticket_number": ticket['ticket_number'],
-                "user_telegram_id": ticket['user_telegram_id'],
-                "user_telegram_name": ticket['user_telegram_name'],
-                "agent_username": comment['username'],
-                "comment": comment['comment'],
-                "timestamp": comment['timestamp']
-            })
-    
+    return await _telegram_deliveries(None, db)
+
+@router.get("/comments/telegram-outbox")
+async def read_telegram_outbox(
+    consumer: str = "bot",
+    count: int = 100,
+    block_ms: int = 5000,
+    current_user: User = Depends(get_current_user),
+    db = Depends(get_db),
+    redis = Depends(get_redis)
+):
+    """Read a batch of comments to relay via the outbox consumer group. Unacknowledged
+    entries are redelivered to the same consumer on its next read."""
+    if not is_admin_role(current_user.role) and current_user.role != "agent":
+        raise HTTPException(status_code=403, detail="Hak akses admin/agent diperlukan")
+    if count < 1 or block_ms < 0:
+        raise HTTPException(status_code=400, detail="count harus >= 1 dan block_ms harus >= 0")
+    
+    entries = await telegram_outbox.read_batch(consumer, min(count, 1000), block_ms, redis)
+    if not entries:
+        return []
+    deliveries = {d['comment_id']: d for d in await _telegram_deliveries([c for _, c in entries], db)}
+    result, stale = [], []
+    for stream_id, comment_id in entries:
+        if comment_id in deliveries:
+            result.append({**deliveries[comment_id], "stream_id": stream_id})
+        else:
+            # Comment deleted or already delivered through the polling endpoint
+            stale.append(stream_id)
+    await telegram_outbox.ack(stale, redis)
     return result
 
+@router.post("/comments/telegram-outbox/ack")
+async def ack_telegram_deliveries(
+    ack: TelegramDeliveryAck,
+    current_user: User = Depends(get_current_user),
+    db = Depends(get_db),
+    redis = Depends(get_redis)
+):
+    """Mark many comments as sent (and acknowledge their outbox entries) in one call"""
+    if not is_admin_role(current_user.role) and current_user.role != "agent":
+        raise HTTPException(status_code=403, detail="Hak akses admin/agent diperlukan")
+    
+    result = await db.comments.update_many(
+        {"id": {"$in": ack.comment_ids}},
+        {"$set": {"sent_to_telegram": True}}
+    )
+    await telegram_outbox.ack(ack.stream_ids, redis)
+    return {"message": "Komentar berhasil disimpan", "count": result.modified_count}
+
 @router.put("/comments/{comment_id}/mark-sent")
 async def mark_comment_as_sent(comment_id: str, db = Depends(get_db)):
     result = await db.comments.update_one(
@@ -439,17 +559,19 @@ async def mark_comment_as_sent(comment_id: str, db = Depends(get_db)):
 
 @router.put("/{ticket_id}/mark-read")
 async def mark_ticket_read(ticket_id: str, current_user: User = Depends(get_current_user), db = Depends(get_db)):
-    """Mark all user comments in this ticket as read (clear badge)"""
+    """Reset the ticket's unread reply counter (clear badge)"""
     # Only agents can mark as read
     if current_user.role != "agent":
         raise HTTPException(status_code=403, detail="Hak akses agent diperlukan")
     
-    # Mark all user comments in this ticket as read
-    result = await db.comments.update_many(
-        {"ticket_id": ticket_id, "role": "user", "read_by_agent": False},
-        {"$set": {"read_by_agent": True}}
+    # The pre-image tells how many replies were just marked read
+    previous = await db.tickets.find_one_and_update(
+        {"id": ticket_id},
+        {"$set": {"unread_user_replies": 0, "last_read_at": datetime.now(timezone.utc)}},
+        projection={"_id": 0, "unread_user_replies": 1}
     )
+    count = (previous or {}).get("unread_user_replies", 0)
     
-    logger.info(f"Marked {result.modified_count} comments as read for ticket {ticket_id}")
+    logger.info(f"Marked {count} replies as read for ticket {ticket_id}")
     
-    return {"message": "Marked as read", "count": result.modified_count}
+    return {"message": "Marked as read", "count": count}
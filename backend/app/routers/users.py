@@ -2,11 +2,14 @@ from fastapi import APIRouter, HTTPException, Depends
 from typing import List, Optional
 from pydantic import BaseModel
 import re
-from ..core.database import get_db
+from ..core.database import get_db, get_redis
 from ..core.deps import get_current_user, is_admin_role, ADMIN_ROLES
 from ..core.security import get_password_hash, verify_password
 from ..models.user import User
 from ..core.logging import logger
+from ..core.user_cache import publish_user_change
+from ..services import presence
+from ..services.two_tier_cache import reference_cache, AGENTS_KEY
 
 router = APIRouter()
 
@@ -30,11 +33,20 @@ async def get_pending_users(current_user: User = Depends(get_current_user), db =
     return [User(**u) for u in users]
 
 @router.get("/agents", response_model=List[User])
-async def get_agents(current_user: User = Depends(get_current_user), db = Depends(get_db)):
+async def get_agents(current_user: User = Depends(get_current_user), db = Depends(get_db), redis = Depends(get_redis)):
     # Allow agents to see other agents for assignment if needed, or just admin
     # For now, let's allow both
-    users = await db.users.find({"role": "agent", "status": "approved"}, {"_id": 0}).to_list(1000)
-    return [User(**u) for u in users]
+    async def load():
+        users = await db.users.find({"role": "agent", "status": "approved"}, {"_id": 0}).to_list(1000)
+        return [User(**u).model_dump(mode="json") for u in users]
+    
+    return [User(**u) for u in await reference_cache.get_or_load(AGENTS_KEY, load, redis)]
+
+@router.get("/online-agents")
+async def get_online_agents(current_user: User = Depends(get_current_user), redis = Depends(get_redis)):
+    """Agents with a live WebSocket heartbeat (see services/presence.py)"""
+    agent_ids = await presence.get_online("agent", redis)
+    return {"agent_ids": agent_ids, "count": len(agent_ids)}
 
 @router.get("/admins", response_model=List[User])
 async def get_admins(current_user: User = Depends(get_current_user), db = Depends(get_db)):
@@ -57,7 +69,8 @@ async def approve_user(
     user_id: str, 
     role: str = "agent", # Default to agent if not specified
     current_user: User = Depends(get_current_user),
-    db = Depends(get_db)
+    db = Depends(get_db),
+    redis = Depends(get_redis)
 ):
     if not is_admin_role(current_user.role):
         raise HTTPException(status_code=403, detail="Hak akses admin diperlukan")
@@ -74,11 +87,13 @@ async def approve_user(
         logger.warning(f"Failed to approve user {user_id}: User not found")
         raise HTTPException(status_code=404, detail="User tidak ditemukan")
     
+    await publish_user_change(user_id, redis)
+    await reference_cache.invalidate(redis, AGENTS_KEY)
     logger.info(f"User {user_id} approved as {role} by {current_user.username}")
     return {"message": f"User approved as {role}"}
 
 @router.delete("/{user_id}")
-async def delete_user(user_id: str, current_user: User = Depends(get_current_user), db = Depends(get_db)):
+async def delete_user(user_id: str, current_user: User = Depends(get_current_user), db = Depends(get_db), redis = Depends(get_redis)):
     if not is_admin_role(current_user.role):
         raise HTTPException(status_code=403, detail="Hak akses admin diperlukan")
     
@@ -87,6 +102,8 @@ async def delete_user(user_id: str, current_user: User = Depends(get_current_use
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User tidak ditemukan")
     
+    await publish_user_change(user_id, redis)
+    await reference_cache.invalidate(redis, AGENTS_KEY)
     return {"message": "User deleted"}
 
 @router.put("/{user_id}/reset-password")
@@ -94,7 +111,7 @@ async def reset_password(user_id: str, request: ResetPasswordRequest, current_us
     if not is_admin_role(current_user.role):
         raise HTTPException(status_code=403, detail="Hak akses admin diperlukan")
     
-    hashed_password = get_password_hash(request.new_password)
+    hashed_password = await get_password_hash(request.new_password)
     result = await db.users.update_one(
         {"id": user_id},
         {"$set": {"password_hash": hashed_password}}
@@ -112,7 +129,8 @@ async def reset_password(user_id: str, request: ResetPasswordRequest, current_us
 async def update_profile(
     request: UpdateProfileRequest, 
     current_user: User = Depends(get_current_user), 
-    db = Depends(get_db)
+    db = Depends(get_db),
+    redis = Depends(get_redis)
 ):
     update_data = {}
     
@@ -151,6 +169,9 @@ async def update_profile(
     if result.modified_count == 0:
         raise HTTPException(status_code=400, detail="Gagal memperbarui profil")
     
+    await publish_user_change(current_user.id, redis)
+    await reference_cache.invalidate(redis, AGENTS_KEY)
+    
     # Get updated user data
     updated_user = await db.users.find_one({"id": current_user.id}, {"_id": 0, "password_hash": 0})
     logger.info(f"User {current_user.id} updated profile: {update_data.keys()}")
@@ -170,7 +191,7 @@ async def change_password(
         raise HTTPException(status_code=404, detail="User tidak ditemukan")
     
     # Verify current password
-    if not verify_password(request.current_password, user.get("password_hash", "")):
+    if not await verify_password(request.current_password, user.get("password_hash", "")):
         raise HTTPException(status_code=400, detail="Kata sandi saat ini salah")
     
     # Validate new password
@@ -178,7 +199,7 @@ async def change_password(
         raise HTTPException(status_code=400, detail="Kata sandi baru minimal 6 karakter")
     
     # Hash and update new password
-    hashed_password = get_password_hash(request.new_password)
+    hashed_password = await get_password_hash(request.new_password)
     result = await db.users.update_one(
         {"id": current_user.id},
         {"$set": {"password_hash": hashed_password}}
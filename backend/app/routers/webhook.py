@@ -1,36 +1,27 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, HTTPException
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from datetime import datetime, timezone
+from typing import List, Optional
 import uuid
-import random
-import string
 from ..core.database import get_db, get_redis
+from ..core.deps import get_current_user, is_admin_role
 from ..models.ticket import Ticket, TicketCreate
+from ..models.user import User
 from ..core.logging import logger
+from ..services import assignment, data_versions, ticket_facets
+from ..services.idempotency import IdempotencyGuard
+from ..services.ticket_numbers import allocate_ticket_numbers, next_ticket_number
 
 router = APIRouter()
 
+BULK_MAX_TICKETS = 500
+
 class TelegramWebhookRequest(TicketCreate):
     """Request model for Telegram bot webhook - extends TicketCreate but ticket_number is optional"""
     ticket_number: str | None = None  # Override to make it optional
 
-@router.post("/telegram", response_model=Ticket)
-async def telegram_webhook(request: TelegramWebhookRequest, db = Depends(get_db), redis = Depends(get_redis)):
-    """Endpoint for Telegram Bot to create tickets (No Auth required for bot)"""
-    
-    # Generate Ticket Number if not provided
-    # Format: INC${MM}${DD}${YYYY}${HH}${mm}${ss}${randomText}
-    # Example: INC111520251928405B6
-    if not request.ticket_number:
-        now = datetime.now()
-        date_str = now.strftime("%m%d%Y%H%M%S")
-        random_str = ''.join(random.choices(string.ascii_uppercase + string.digits, k=3))
-        ticket_number = f"INC{date_str}{random_str}"
-    else:
-        ticket_number = request.ticket_number
-    
-    logger.info(f"Creating ticket from Telegram webhook: {ticket_number}")
-    
-    # Create Ticket object
+def _build_ticket(request: TelegramWebhookRequest, ticket_number: str) -> dict:
     ticket_dict = request.model_dump(exclude={'ticket_number'})
     ticket_dict['ticket_number'] = ticket_number
     ticket_dict['status'] = 'open'
@@ -38,17 +29,91 @@ async def telegram_webhook(request: TelegramWebhookRequest, db = Depends(get_db)
     ticket_dict['id'] = str(uuid.uuid4())
     ticket_dict['assigned_agent'] = None
     ticket_dict['assigned_agent_name'] = None
+    return ticket_dict
+
+def _to_document(ticket_dict: dict) -> dict:
+    return {**ticket_dict, 'created_at': ticket_dict['created_at'].isoformat()}
+
+@router.post("/telegram", response_model=Ticket)
+async def telegram_webhook(
+    request: TelegramWebhookRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db = Depends(get_db),
+    redis = Depends(get_redis)
+):
+    """Endpoint for Telegram Bot to create tickets (No Auth required for bot)"""
+    async with IdempotencyGuard("webhook", idempotency_key, redis) as guard:
+        if guard.replay is not None:
+            return guard.replay
+        
+        ticket_dict = _build_ticket(request, request.ticket_number or await next_ticket_number(db))
+        logger.info(f"Creating ticket from Telegram webhook: {ticket_dict['ticket_number']}")
+        
+        # Insert into DB
+        try:
+            await db.tickets.insert_one(_to_document(ticket_dict))
+        except DuplicateKeyError:
+            raise HTTPException(status_code=409, detail="Nomor tiket sudah digunakan")
+        
+        await data_versions.bump(redis, data_versions.ticket_scopes(ticket_dict))
+        await ticket_facets.record_created([ticket_dict], redis)
+        
+        logger.info(f"Ticket {ticket_dict['ticket_number']} created successfully")
+        
+        await assignment.assign_new_ticket(ticket_dict['id'], db, redis)
+        
+        # Return as Ticket model
+        ticket = Ticket(**ticket_dict)
+        guard.response = ticket.model_dump(mode="json")
+        return ticket
+
+@router.post("/telegram/bulk")
+async def telegram_webhook_bulk(
+    items: List[dict],
+    current_user: User = Depends(get_current_user),
+    db = Depends(get_db),
+    redis = Depends(get_redis)
+):
+    """Create many tickets in one call (bulk imports, bot replays). Items are validated and
+    written independently; the response has one result per item, in request order.
+    Requires an admin/agent user or service API key."""
+    if not is_admin_role(current_user.role) and current_user.role != "agent":
+        raise HTTPException(status_code=403, detail="Hak akses admin/agent diperlukan")
+    if len(items) > BULK_MAX_TICKETS:
+        raise HTTPException(status_code=400, detail=f"Maksimal {BULK_MAX_TICKETS} tiket per batch")
+    
+    results = [None] * len(items)
+    requests = []  # (request index, validated request)
+    for index, item in enumerate(items):
+        try:
+            requests.append((index, TelegramWebhookRequest.model_validate(item)))
+        except ValidationError as e:
+            results[index] = {"index": index, "status": "error", "detail": e.errors(include_url=False, include_context=False)}
+    
+    # One counter update numbers the whole batch
+    missing = sum(1 for _, r in requests if not r.ticket_number)
+    numbers = iter(await allocate_ticket_numbers(db, missing) if missing else [])
+    tickets = [(index, _build_ticket(r, r.ticket_number or next(numbers))) for index, r in requests]
     
-    # Insert into DB
-    await db.tickets.insert_one({
-        **ticket_dict,
-        'created_at': ticket_dict['created_at'].isoformat()
-    })
+    failed_positions = {}
+    if tickets:
+        try:
+            await db.tickets.insert_many([_to_document(t) for _, t in tickets], ordered=False)
+        except BulkWriteError as e:
+            failed_positions = {err['index']: err.get('errmsg', 'Gagal menyimpan tiket') for err in e.details.get('writeErrors', [])}
     
-    # Invalidate cache
-    await redis.delete("dashboard:admin:stats:v2")
+    created = []
+    for position, (index, ticket_dict) in enumerate(tickets):
+        if position in failed_positions:
+            results[index] = {"index": index, "status": "error", "detail": failed_positions[position]}
+        else:
+            created.append(ticket_dict)
+            results[index] = {"index": index, "status": "created", "id": ticket_dict['id'], "ticket_number": ticket_dict['ticket_number']}
     
-    logger.info(f"Ticket {ticket_number} created successfully")
+    if created:
+        await data_versions.bump(redis, [scope for t in created for scope in data_versions.ticket_scopes(t)])
+        await ticket_facets.record_created(created, redis)
+        await assignment.assign_new_tickets([t['id'] for t in created], db, redis)
     
-    # Return as Ticket model
-    return Ticket(**ticket_dict)
+    logger.info(f"Bulk webhook: {len(created)} of {len(items)} tickets created")
+    return {"created": len(created), "failed": len(items) - len(created), "results": results}
@@ -0,0 +1,282 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from pymongo import UpdateOne
+from ..core.config import settings
+from ..core.database import redis_client
+from ..core.logging import logger
+from ..models.user import User
+from ..routers import notifications
+from .telegram import notify_ticket_claimed
+from . import data_versions, presence
+
+# Online agents, scored by (active tickets, last assignment time) so ZRANGE 0 0
+# is always the least loaded agent who has waited longest for a ticket
+POOL_KEY = "assignment:agents"
+# Tickets waiting for a free slot, oldest first
+QUEUE_KEY = "assignment:queue"
+# Display names of pooled agents, so assigning needs no users lookup
+NAMES_KEY = "assignment:agent_names"
+
+# score = active tickets * SCORE_SCALE + last assignment time in ms
+SCORE_SCALE = 10 ** 13
+ACTIVE_STATUSES = ["in_progress", "pending"]
+
+# Best pooled agent with a heartbeat in the online set (KEYS[4]) at or after ARGV[5].
+# Agents whose presence lapsed are skipped but keep their place and load in the pool,
+# so they are picked again as soon as their heartbeat resumes. `exclude` is never picked.
+_PICK_AGENT_LUA = """
+local function pick_agent(exclude)
+    local rank = 0
+    while true do
+        local best = redis.call('ZRANGE', KEYS[1], rank, rank, 'WITHSCORES')
+        if #best == 0 then
+            return best
+        end
+        local seen = redis.call('ZSCORE', KEYS[4], best[1])
+        if best[1] ~= exclude and seen and tonumber(seen) >= tonumber(ARGV[5]) then
+            return best
+        end
+        rank = rank + 1
+    end
+end
+"""
+
+# Give the ticket to the best agent with a free slot, or queue it unless the queue
+# already holds ARGV[6] tickets, skipping agent ARGV[7]. Returns the agent id, false if
+# queued, 0 if not queued.
+_ASSIGN_LUA = _PICK_AGENT_LUA + """
+local scale = tonumber(ARGV[4])
+local best = pick_agent(ARGV[7])
+if #best == 0 or math.floor(tonumber(best[2]) / scale) >= tonumber(ARGV[2]) then
+    if redis.call('LLEN', KEYS[2]) >= tonumber(ARGV[6]) then
+        return 0
+    end
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    return false
+end
+local load = math.floor(tonumber(best[2]) / scale) + 1
+redis.call('ZADD', KEYS[1], string.format('%.0f', load * scale + tonumber(ARGV[3])), best[1])
+return best[1]
+"""
+
+# Free one slot of an agent (if pooled), append new tickets ARGV[7..] to the queue while it
+# holds fewer than ARGV[6], then hand queued tickets to agents with free slots.
+# Returns {tickets not queued, ticket_id, agent_id, ...} for the assignments made.
+_RELEASE_AND_DRAIN_LUA = _PICK_AGENT_LUA + """
+local scale = tonumber(ARGV[4])
+local max_load = tonumber(ARGV[2])
+if ARGV[1] ~= '' then
+    local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+    if score and tonumber(score) >= scale then
+        redis.call('ZADD', KEYS[1], string.format('%.0f', tonumber(score) - scale), ARGV[1])
+    end
+end
+local dropped = 0
+for i = 7, #ARGV do
+    if redis.call('LLEN', KEYS[2]) < tonumber(ARGV[6]) then
+        redis.call('RPUSH', KEYS[2], ARGV[i])
+    else
+        dropped = dropped + 1
+    end
+end
+local assigned = {dropped}
+while redis.call('LLEN', KEYS[2]) > 0 do
+    local best = pick_agent()
+    if #best == 0 then break end
+    local load = math.floor(tonumber(best[2]) / scale)
+    if load >= max_load then break end
+    local ticket_id = redis.call('LPOP', KEYS[2])
+    redis.call('ZADD', KEYS[1], string.format('%.0f', (load + 1) * scale + tonumber(ARGV[3])), best[1])
+    table.insert(assigned, ticket_id)
+    table.insert(assigned, best[1])
+end
+return assigned
+"""
+
+_assign_script = redis_client.register_script(_ASSIGN_LUA)
+_release_and_drain_script = redis_client.register_script(_RELEASE_AND_DRAIN_LUA)
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+def _load_from_score(score: float) -> int:
+    return int(score // SCORE_SCALE)
+
+def _script_keys() -> List[str]:
+    return [POOL_KEY, QUEUE_KEY, NAMES_KEY, presence.online_key("agent")]
+
+async def go_online(agent: User, db, redis) -> int:
+    """Mark an agent present and add them to the pool"""
+    await presence.heartbeat(agent, redis)
+    return await join_pool(agent, db, redis)
+
+async def join_pool(agent: User, db, redis) -> int:
+    """Add an agent to the pool with their current workload and hand them queued tickets.
+    Called when their presence starts (first WebSocket heartbeat); they stay in the pool
+    only while that heartbeat is alive."""
+    load = await db.tickets.count_documents({"assigned_agent": agent.id, "status": {"$in": ACTIVE_STATUSES}})
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hset(NAMES_KEY, agent.id, agent.full_name or agent.username)
+        pipe.zadd(POOL_KEY, {agent.id: load * SCORE_SCALE})
+        await pipe.execute()
+    logger.info(f"Agent {agent.username} online for auto-assignment with {load} active tickets")
+    await release_slot(None, db, redis)
+    return load
+
+async def go_offline(agent_id: str, redis):
+    """Remove an agent from the pool; their current tickets stay with them"""
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.zrem(POOL_KEY, agent_id)
+        pipe.hdel(NAMES_KEY, agent_id)
+        await pipe.execute()
+
+async def assign_new_ticket(ticket_id: str, db, redis, exclude_agent: Optional[str] = None) -> Optional[str]:
+    """Atomically reserve a slot for a new ticket. Returns the agent id, or None if it was queued.
+    `exclude_agent` (e.g. the agent who just gave the ticket up) is never picked."""
+    agent_id = await _assign_script(
+        keys=_script_keys(),
+        args=[
+            ticket_id, settings.MAX_TICKETS_PER_AGENT, _now_ms(), SCORE_SCALE,
+            presence.online_since_ms(), settings.ASSIGNMENT_QUEUE_MAX, exclude_agent or ""
+        ],
+        client=redis
+    )
+    if agent_id is None:
+        logger.info(f"No agent slot free, ticket {ticket_id} queued")
+        return None
+    if not agent_id:
+        logger.warning(f"Assignment queue full, ticket {ticket_id} left open for manual claim")
+        return None
+    if not await _apply_assignment(ticket_id, agent_id, db, redis):
+        await release_slot(agent_id, db, redis)
+        return None
+    return agent_id
+
+async def assign_new_tickets(ticket_ids: List[str], db, redis) -> Dict[str, str]:
+    """Auto-assign a batch of new tickets: one script call queues them all and hands out
+    free slots, and the assignments are written with one bulk update. Returns {ticket_id: agent_id}."""
+    if not ticket_ids:
+        return {}
+    return await _drain(None, db, redis, ticket_ids)
+
+async def release_slot(agent_id: Optional[str], db, redis):
+    """Free one slot of an agent (completion/unassignment) and refill free slots from the queue"""
+    await _drain(agent_id, db, redis)
+
+async def _drain(agent_id: Optional[str], db, redis, new_ticket_ids: List[str] = ()) -> Dict[str, str]:
+    applied: Dict[str, str] = {}
+    pending: List[Optional[str]] = [agent_id]
+    enqueue = list(new_ticket_ids)
+    while pending:
+        result = await _release_and_drain_script(
+            keys=_script_keys(),
+            args=[
+                pending.pop() or "", settings.MAX_TICKETS_PER_AGENT, _now_ms(), SCORE_SCALE,
+                presence.online_since_ms(), settings.ASSIGNMENT_QUEUE_MAX, *enqueue
+            ],
+            client=redis
+        )
+        enqueue = []
+        dropped, assigned = result[0], result[1:]
+        if dropped:
+            logger.warning(f"Assignment queue full, {dropped} tickets left open for manual claim")
+        reserved = dict(zip(assigned[::2], assigned[1::2]))
+        done = await _apply_assignments(reserved, db, redis)
+        applied.update(done)
+        # Stale queue entries: give the slots back and keep draining
+        pending.extend(agent for ticket_id, agent in reserved.items() if ticket_id not in done)
+    return applied
+
+async def record_manual_assignment(ticket_id: str, agent_id: str, previous_agent: Optional[str], db, redis):
+    """Keep slot accounting in sync when a ticket is claimed or reassigned by hand"""
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.lrem(QUEUE_KEY, 0, ticket_id)
+        pipe.zadd(POOL_KEY, {agent_id: SCORE_SCALE}, xx=True, incr=True)
+        await pipe.execute()
+    if previous_agent and previous_agent != agent_id:
+        await release_slot(previous_agent, db, redis)
+
+async def forget_ticket(ticket_id: str, redis):
+    """Drop a deleted ticket from the waiting queue"""
+    await redis.lrem(QUEUE_KEY, 0, ticket_id)
+
+async def get_workload(redis) -> dict:
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.zrange(POOL_KEY, 0, -1, withscores=True)
+        pipe.hgetall(NAMES_KEY)
+        pipe.llen(QUEUE_KEY)
+        pipe.zrangebyscore(presence.online_key("agent"), presence.online_since_ms(), "+inf")
+        pool, names, queued, online = await pipe.execute()
+    online = set(online)
+    agents = [
+        {
+            "agent_id": agent_id,
+            "agent_name": names.get(agent_id, agent_id),
+            "active_tickets": _load_from_score(score),
+            "max_tickets": settings.MAX_TICKETS_PER_AGENT,
+            "online": agent_id in online
+        }
+        for agent_id, score in pool
+    ]
+    return {"agents": agents, "queued_tickets": queued}
+
+async def _apply_assignment(ticket_id: str, agent_id: str, db, redis) -> bool:
+    """Write a reserved assignment to the ticket. False if it was claimed or deleted meanwhile."""
+    agent_name = await redis.hget(NAMES_KEY, agent_id) or "Agent"
+    changes = _assignment_changes(agent_id, agent_name)
+    previous = await db.tickets.find_one_and_update(
+        {"id": ticket_id, "assigned_agent": None, "status": "open"},
+        {"$set": changes},
+        projection={"_id": 0}
+    )
+    if not previous:
+        logger.info(f"Ticket {ticket_id} no longer open, skipping auto-assignment")
+        return False
+    await _announce([{**previous, **changes}], redis)
+    return True
+
+async def _apply_assignments(reserved: Dict[str, str], db, redis) -> Dict[str, str]:
+    """Write many reserved assignments with one bulk update. Returns the ones that were
+    applied; tickets claimed or deleted meanwhile are left out."""
+    if not reserved:
+        return {}
+    agent_ids = list(set(reserved.values()))
+    names = dict(zip(agent_ids, await redis.hmget(NAMES_KEY, agent_ids)))
+    candidates = await db.tickets.find(
+        {"id": {"$in": list(reserved)}, "assigned_agent": None, "status": "open"},
+        {"_id": 0}
+    ).to_list(len(reserved))
+    if not candidates:
+        return {}
+
+    changes = {t['id']: _assignment_changes(reserved[t['id']], names.get(reserved[t['id']]) or "Agent") for t in candidates}
+    result = await db.tickets.bulk_write([
+        UpdateOne({"id": ticket_id, "assigned_agent": None, "status": "open"}, {"$set": change})
+        for ticket_id, change in changes.items()
+    ], ordered=False)
+    if result.matched_count != len(candidates):
+        # Someone claimed a ticket between the read and the write: keep only what we wrote
+        current = await db.tickets.find({"id": {"$in": list(changes)}}, {"_id": 0, "id": 1, "assigned_agent": 1}).to_list(len(changes))
+        ours = {t['id'] for t in current if t.get('assigned_agent') == reserved[t['id']]}
+        candidates = [t for t in candidates if t['id'] in ours]
+
+    await _announce([{**t, **changes[t['id']]} for t in candidates], redis)
+    return {t['id']: reserved[t['id']] for t in candidates}
+
+def _assignment_changes(agent_id: str, agent_name: str) -> dict:
+    return {
+        "assigned_agent": agent_id,
+        "assigned_agent_name": agent_name,
+        "status": "in_progress",
+        "updated_at": datetime.now(timezone.utc)
+    }
+
+async def _announce(tickets: List[dict], redis):
+    """Notify agents, admins and Telegram users about applied assignments"""
+    for ticket in tickets:
+        logger.info(f"Ticket {ticket['ticket_number']} auto-assigned to {ticket['assigned_agent_name']}")
+        asyncio.create_task(notify_ticket_claimed(ticket))
+    await notifications.notify_tickets_assigned(tickets)
+    await data_versions.bump(redis, [scope for t in tickets for scope in data_versions.ticket_scopes(t)])
@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+from typing import Iterable, List
+
+# Cached results are keyed by the version of every scope they read. A write bumps the
+# versions of the scopes it touches, so all dependent cache entries (whatever filters
+# they were built for) stop being read at once and simply expire.
+GLOBAL_SCOPE = "global"
+CACHE_TTL_SECONDS = 300
+
+def agent_scope(agent_id: str) -> str:
+    return f"agent:{agent_id}"
+
+def month_scope(year: int, month: int) -> str:
+    """Tickets created in a calendar month (UTC), matching the year/month report filters"""
+    return f"month:{year:04d}-{month:02d}"
+
+def _version_key(scope: str) -> str:
+    return f"dataver:{scope}"
+
+def ticket_scopes(ticket: dict, *other_agents) -> List[str]:
+    """Scopes a write to this ticket affects: global, its creation month and every agent involved"""
+    scopes = [GLOBAL_SCOPE]
+    created = ticket.get('created_at')
+    if isinstance(created, str):
+        created = datetime.fromisoformat(created)
+    if created:
+        if created.tzinfo is not None:
+            created = created.astimezone(timezone.utc)
+        scopes.append(month_scope(created.year, created.month))
+    for agent_id in (ticket.get('assigned_agent'), *other_agents):
+        if agent_id:
+            scopes.append(agent_scope(agent_id))
+    return list(dict.fromkeys(scopes))
+
+async def bump(redis, scopes: Iterable[str]):
+    """Invalidate everything cached under these scopes, in one round trip"""
+    async with redis.pipeline(transaction=False) as pipe:
+        for scope in dict.fromkeys(scopes):
+            pipe.incr(_version_key(scope))
+        await pipe.execute()
+
+async def cache_key(redis, name: str, scopes: List[str], **params) -> str:
+    """Cache key for `name` built from the current versions of `scopes` and the filter params"""
+    versions = await redis.mget([_version_key(scope) for scope in scopes])
+    parts = [f"{scope}@{version or 0}" for scope, version in zip(scopes, versions)]
+    parts += [f"{key}={value}" for key, value in sorted(params.items()) if value is not None]
+    return f"cache:{name}:" + "|".join(parts)
@@ -0,0 +1,58 @@
+import asyncio
+import json
+import time
+from typing import Any, Optional
+from fastapi import HTTPException
+from ..core.logging import logger
+
+# Stored responses are replayed for retries within this window
+RESPONSE_TTL_SECONDS = 24 * 60 * 60
+# A request that dies mid-way must not block its retries for longer than this
+IN_FLIGHT_TTL_SECONDS = 60
+# A retry arriving while the first attempt still runs (client timed out) waits this long
+# for its stored response before giving up with 409
+IN_FLIGHT_WAIT_SECONDS = 8
+IN_FLIGHT_POLL_SECONDS = 0.2
+_IN_FLIGHT = "__in_flight__"
+
+def idempotency_key(scope: str, key: str) -> str:
+    return f"idempotency:{scope}:{key}"
+
+class IdempotencyGuard:
+    """Claims an Idempotency-Key with SET NX for the duration of a request. Set `response`
+    to have it stored for retries; if `replay` is set, return it instead of doing the work.
+    On error the claim is dropped so the client can retry. A None key disables the guard."""
+
+    def __init__(self, scope: str, key: Optional[str], redis):
+        self.redis_key = idempotency_key(scope, key) if key else None
+        self.redis = redis
+        self.replay: Optional[Any] = None
+        self.response: Optional[Any] = None
+        self._claimed = False
+
+    async def __aenter__(self):
+        if not self.redis_key:
+            return self
+        deadline = time.monotonic() + IN_FLIGHT_WAIT_SECONDS
+        while True:
+            if await self.redis.set(self.redis_key, _IN_FLIGHT, nx=True, ex=IN_FLIGHT_TTL_SECONDS):
+                # First attempt, or the previous one failed and released the key
+                self._claimed = True
+                return self
+            stored = await self.redis.get(self.redis_key)
+            if stored is not None and stored != _IN_FLIGHT:
+                logger.info(f"Replaying stored response for {self.redis_key}")
+                self.replay = json.loads(stored)
+                return self
+            if time.monotonic() >= deadline:
+                raise HTTPException(status_code=409, detail="Permintaan yang sama sedang diproses, silakan coba lagi")
+            await asyncio.sleep(IN_FLIGHT_POLL_SECONDS)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if not self._claimed:
+            return False
+        if exc_type is None and self.response is not None:
+            await self.redis.set(self.redis_key, json.dumps(self.response, default=str), ex=RESPONSE_TTL_SECONDS)
+        else:
+            await self.redis.delete(self.redis_key)
+        return False
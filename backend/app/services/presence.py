@@ -0,0 +1,39 @@
+import time
+from typing import List
+from ..models.user import User
+
+# A user counts as online until PRESENCE_TTL_SECONDS after their last heartbeat
+# (the frontend pings every 30s, so this tolerates two missed pings)
+PRESENCE_TTL_SECONDS = 90
+
+def presence_key(user_id: str) -> str:
+    """Expiring per-user key, for O(1) "is this user online?" checks"""
+    return f"presence:user:{user_id}"
+
+def online_key(role: str) -> str:
+    """Per-role sorted set of user ids scored by last heartbeat (ms)"""
+    return f"presence:online:{role}"
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+def online_since_ms() -> int:
+    """Oldest heartbeat time (ms) that still counts as online"""
+    return _now_ms() - PRESENCE_TTL_SECONDS * 1000
+
+async def heartbeat(user: User, redis) -> bool:
+    """Refresh a user's presence; stale members of their role set are pruned on the way.
+    Returns False if the user was offline before this heartbeat."""
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.set(presence_key(user.id), user.role, ex=PRESENCE_TTL_SECONDS, get=True)
+        pipe.zadd(online_key(user.role), {user.id: _now_ms()})
+        pipe.zremrangebyscore(online_key(user.role), "-inf", online_since_ms())
+        previous, _, _ = await pipe.execute()
+    return previous is not None
+
+async def is_online(user_id: str, redis) -> bool:
+    return bool(await redis.exists(presence_key(user_id)))
+
+async def get_online(role: str, redis) -> List[str]:
+    """Ids of users of a role with a heartbeat inside the TTL window"""
+    return await redis.zrangebyscore(online_key(role), online_since_ms(), "+inf")
@@ -2,6 +2,7 @@ import httpx
 import logging
 import asyncio
 from ..core.config import settings
+from ..core.metrics import TELEGRAM_SENDS
 
 # Reusable HTTP client with connection pooling
 _http_client = None
@@ -47,19 +48,24 @@ async def send_telegram_message(chat_id: str, text: str, ticket_id: str = None,
             
             if response.status_code == 200:
                 logging.info("Telegram message sent successfully")
+                TELEGRAM_SENDS.inc(method="sendMessage", outcome="sent")
                 return True
             elif response.status_code == 429:
+                TELEGRAM_SENDS.inc(method="sendMessage", outcome="rate_limited")
                 # Rate limited - wait and retry
                 retry_after = int(response.headers.get('Retry-After', 5))
                 logging.warning(f"Rate limited by Telegram, waiting {retry_after}s")
                 await asyncio.sleep(retry_after)
             else:
+                TELEGRAM_SENDS.inc(method="sendMessage", outcome="error")
                 logging.error(f"Telegram API Error ({response.status_code}): {response.text}")
                 
         except httpx.TimeoutException:
+            TELEGRAM_SENDS.inc(method="sendMessage", outcome="timeout")
             logging.error(f"Telegram request timeout (attempt {attempt + 1})")
             await asyncio.sleep(1)
         except httpx.ConnectError as e:
+            TELEGRAM_SENDS.inc(method="sendMessage", outcome="error")
             logging.error(f"Telegram connection error: {e}")
             # Reset client on connection error
             global _http_client
@@ -68,10 +74,12 @@ async def send_telegram_message(chat_id: str, text: str, ticket_id: str = None,
                 _http_client = None
             await asyncio.sleep(1)
         except Exception as e:
+            TELEGRAM_SENDS.inc(method="sendMessage", outcome="error")
             logging.error(f"Failed to send Telegram message: {e}")
             await asyncio.sleep(1)
     
     logging.error(f"Failed to send Telegram message after {retry_count} attempts")
+    TELEGRAM_SENDS.inc(method="sendMessage", outcome="failed")
     return False
 
 async def send_telegram_photo(chat_id: str, photo_url: str, caption: str = None, ticket_id: str = None, retry_count: int = 3):
@@ -112,24 +120,63 @@ async def send_telegram_photo(chat_id: str, photo_url: str, caption: str = None,
             
             if response.status_code == 200:
                 logging.info("Telegram photo sent successfully")
+                TELEGRAM_SENDS.inc(method="sendPhoto", outcome="sent")
                 return True
             elif response.status_code == 429:
+                TELEGRAM_SENDS.inc(method="sendPhoto", outcome="rate_limited")
                 retry_after = int(response.headers.get('Retry-After', 5))
                 logging.warning(f"Rate limited by Telegram, waiting {retry_after}s")
                 await asyncio.sleep(retry_after)
             else:
+                TELEGRAM_SENDS.inc(method="sendPhoto", outcome="error")
                 logging.error(f"Telegram API Error ({response.status_code}): {response.text}")
                 
         except httpx.TimeoutException:
+            TELEGRAM_SENDS.inc(method="sendPhoto", outcome="timeout")
             logging.error(f"Telegram photo request timeout (attempt {attempt + 1})")
             await asyncio.sleep(1)
         except Exception as e:
+            TELEGRAM_SENDS.inc(method="sendPhoto", outcome="error")
             logging.error(f"Failed to send Telegram photo: {e}")
             await asyncio.sleep(1)
     
     logging.error(f"Failed to send Telegram photo after {retry_count} attempts")
+    TELEGRAM_SENDS.inc(method="sendPhoto", outcome="failed")
     return False
 
+async def notify_ticket_claimed(ticket: dict):
+    """Tell the reporting user and the support group which agent took a ticket"""
+    agent_name = ticket.get('assigned_agent_name', 'Agent')
+    ticket_number = ticket.get('ticket_number', 'Unknown')
+    user_name = ticket.get('user_telegram_name', 'User')
+    sends = []
+    
+    # Send notification to user (WITHOUT reply button)
+    if ticket.get('user_telegram_id'):
+        logging.info(f"Sending claim notification to user: {ticket.get('user_telegram_id')}")
+        message = (
+            f"Halo *{user_name}*,\n\n"
+            f"Tiket Anda *{ticket_number}* telah diambil oleh *{agent_name}*.\n"
+            f"Mohon tunggu, kami sedang memprosesnya. 👨‍💻"
+        )
+        sends.append(send_telegram_message(ticket.get('user_telegram_id'), message))  # No ticket_id = no reply button
+    else:
+        logging.warning(f"User Telegram ID tidak ditemukan untuk tiket {ticket.get('id')}, skipping user notification")
+    
+    # Send notification to group
+    if settings.GROUP_CHAT_ID:
+        group_message = (
+            f"📌 *Tiket Diambil*\n\n"
+            f"Tiket *{ticket_number}* telah diambil oleh *{agent_name}*.\n"
+            f"User: {user_name}\n"
+            f"Kategori: {ticket.get('category', '-')}"
+        )
+        sends.append(send_telegram_message(settings.GROUP_CHAT_ID, group_message))
+    else:
+        logging.warning("GROUP_CHAT_ID tidak ditemukan, skipping group notification")
+    
+    await asyncio.gather(*sends)
+
 async def close_http_client():
     """Close the HTTP client - call on shutdown"""
     global _http_client
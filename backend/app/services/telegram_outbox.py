@@ -0,0 +1,38 @@
+from typing import List, Optional, Tuple
+from redis.exceptions import ResponseError
+
+# Comments waiting to be relayed to Telegram, read by a relay through a consumer group.
+# Only fed when settings.TELEGRAM_OUTBOX_ENABLED is set; trimmed to ~OUTBOX_MAXLEN entries.
+OUTBOX_STREAM_KEY = "telegram:outbox"
+OUTBOX_GROUP = "telegram-bot"
+OUTBOX_MAXLEN = 10000
+
+async def enqueue(comment_id: str, redis):
+    await redis.xadd(OUTBOX_STREAM_KEY, {"comment_id": comment_id}, maxlen=OUTBOX_MAXLEN, approximate=True)
+
+async def _ensure_group(redis):
+    try:
+        await redis.xgroup_create(OUTBOX_STREAM_KEY, OUTBOX_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+async def read_batch(consumer: str, count: int, block_ms: Optional[int], redis) -> List[Tuple[str, str]]:
+    """(stream_id, comment_id) pairs for a consumer. Entries it read before but never
+    acknowledged (e.g. the bot crashed mid-batch) are redelivered first."""
+    await _ensure_group(redis)
+    entries = await redis.xreadgroup(OUTBOX_GROUP, consumer, {OUTBOX_STREAM_KEY: "0"}, count=count)
+    if not entries or not entries[0][1]:
+        entries = await redis.xreadgroup(OUTBOX_GROUP, consumer, {OUTBOX_STREAM_KEY: ">"}, count=count, block=block_ms or None)
+    if not entries:
+        return []
+    return [(stream_id, fields["comment_id"]) for stream_id, fields in entries[0][1]]
+
+async def ack(stream_ids: List[str], redis):
+    """Acknowledge and drop delivered entries in one round trip"""
+    if not stream_ids:
+        return
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.xack(OUTBOX_STREAM_KEY, OUTBOX_GROUP, *stream_ids)
+        pipe.xdel(OUTBOX_STREAM_KEY, *stream_ids)
+        await pipe.execute()
@@ -0,0 +1,108 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from ..core.database import redis_client
+from ..core.logging import logger
+from .two_tier_cache import reference_cache, TICKET_YEARS_KEY, TICKET_CATEGORIES_KEY
+
+# Ticket counts per creation year and per category, kept up to date on create/delete,
+# so the filter bar's year and category lists cost O(distinct values) instead of a scan.
+# A value whose count drops to zero is removed.
+YEAR_COUNTS_KEY = "tickets:year_counts"
+CATEGORY_COUNTS_KEY = "tickets:category_counts"
+
+# Add ARGV[1] to field ARGV[i + 1] of hash KEYS[i], dropping fields that reach zero. A hash
+# that does not exist is left alone (nil count): it is missing because it was never built
+# or Redis lost it, and creating it here would hide the recount on the next read.
+_APPLY_LUA = """
+local delta = tonumber(ARGV[1])
+local counts = {}
+for i, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        local count = redis.call('HINCRBY', key, ARGV[i + 1], delta)
+        if count <= 0 then
+            redis.call('HDEL', key, ARGV[i + 1])
+        end
+        counts[i] = count
+    else
+        counts[i] = false
+    end
+end
+return counts
+"""
+_apply_script = redis_client.register_script(_APPLY_LUA)
+
+def _year_of(ticket: dict) -> Optional[str]:
+    created = ticket.get('created_at')
+    if isinstance(created, datetime):
+        return str(created.year)
+    if isinstance(created, str) and created[:4].isdigit():
+        return created[:4]
+    return None
+
+async def _apply(tickets: Iterable[dict], delta: int, redis):
+    changes = []  # (hash key, field, cache key)
+    for ticket in tickets:
+        year = _year_of(ticket)
+        if year:
+            changes.append((YEAR_COUNTS_KEY, year, TICKET_YEARS_KEY))
+        if ticket.get('category'):
+            changes.append((CATEGORY_COUNTS_KEY, ticket['category'], TICKET_CATEGORIES_KEY))
+    if not changes:
+        return
+    counts = await _apply_script(
+        keys=[key for key, _, _ in changes],
+        args=[delta, *(field for _, field, _ in changes)],
+        client=redis
+    )
+
+    # Only a value appearing (count == 1 after +1) or disappearing (<= 0) changes the lists
+    stale = set()
+    for (_, _, cache_key), count in zip(changes, counts):
+        if count is None or (delta > 0 and count == delta) or count <= 0:
+            stale.add(cache_key)
+    if stale:
+        await reference_cache.invalidate(redis, *stale)
+
+async def record_created(tickets: List[dict], redis):
+    await _apply(tickets, 1, redis)
+
+async def record_deleted(ticket: dict, redis):
+    await _apply([ticket], -1, redis)
+
+async def rebuild(db, redis) -> Dict[str, int]:
+    """Recount both hashes from the tickets collection (after a Redis flush, or by hand)"""
+    year_pipeline = [
+        {"$match": {"created_at": {"$exists": True}}},
+        {"$group": {"_id": {"$substr": ["$created_at", 0, 4]}, "count": {"$sum": 1}}}
+    ]
+    category_pipeline = [
+        {"$match": {"category": {"$nin": [None, ""]}}},
+        {"$group": {"_id": "$category", "count": {"$sum": 1}}}
+    ]
+    years = {row["_id"]: row["count"] for row in await db.tickets.aggregate(year_pipeline).to_list(None) if row["_id"].isdigit()}
+    categories = {row["_id"]: row["count"] for row in await db.tickets.aggregate(category_pipeline).to_list(None)}
+
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.delete(YEAR_COUNTS_KEY, CATEGORY_COUNTS_KEY)
+        if years:
+            pipe.hset(YEAR_COUNTS_KEY, mapping=years)
+        if categories:
+            pipe.hset(CATEGORY_COUNTS_KEY, mapping=categories)
+        await pipe.execute()
+    await reference_cache.invalidate(redis, TICKET_YEARS_KEY, TICKET_CATEGORIES_KEY)
+    logger.info(f"Rebuilt ticket facets: {len(years)} years, {len(categories)} categories")
+    return {"years": len(years), "categories": len(categories)}
+
+async def _counted_values(key: str, db, redis) -> List[str]:
+    counts = await redis.hgetall(key)
+    if not counts and await db.tickets.estimated_document_count() > 0:
+        # Hash missing (Redis flushed or never built): recount once
+        await rebuild(db, redis)
+        counts = await redis.hgetall(key)
+    return [value for value, count in counts.items() if int(count) > 0]
+
+async def get_years(db, redis) -> List[int]:
+    return sorted((int(y) for y in await _counted_values(YEAR_COUNTS_KEY, db, redis)), reverse=True)
+
+async def get_categories(db, redis) -> List[str]:
+    return sorted(await _counted_values(CATEGORY_COUNTS_KEY, db, redis))
@@ -0,0 +1,26 @@
+from datetime import datetime
+from typing import List
+from pymongo import ReturnDocument
+
+# Format: INC${YYYY}${MM}${DD}${seq:06d}, e.g. INC20251115000042.
+# The date prefix plus a zero-padded per-day counter keeps numbers unique and sortable.
+PREFIX = "INC"
+SEQUENCE_DIGITS = 6
+
+def _counter_id(day: str) -> str:
+    return f"ticket_number:{day}"
+
+async def allocate_ticket_numbers(db, count: int = 1) -> List[str]:
+    """Reserve `count` consecutive ticket numbers with one atomic counter update"""
+    day = datetime.now().strftime("%Y%m%d")
+    counter = await db.counters.find_one_and_update(
+        {"_id": _counter_id(day)},
+        {"$inc": {"seq": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    last = counter["seq"]
+    return [f"{PREFIX}{day}{seq:0{SEQUENCE_DIGITS}d}" for seq in range(last - count + 1, last + 1)]
+
+async def next_ticket_number(db) -> str:
+    return (await allocate_ticket_numbers(db))[0]
@@ -0,0 +1,49 @@
+import json
+from typing import Any, Awaitable, Callable
+from ..core.logging import logger
+from ..core.ttl_cache import TTLCache
+
+class TwoTierCache:
+    """Small, rarely changing results cached in process (short TTL) in front of Redis.
+
+    Writers call invalidate(): the local tier of the calling worker and the Redis tier are
+    dropped at once; other workers pick the change up when their local entry expires."""
+
+    def __init__(self, name: str, local_ttl: float = 10, redis_ttl: int = 3600, max_size: int = 256):
+        self.name = name
+        self.redis_ttl = redis_ttl
+        self.local = TTLCache(max_size, local_ttl)
+
+    def _redis_key(self, key: str) -> str:
+        return f"cache:{self.name}:{key}"
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], redis) -> Any:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        try:
+            cached = await redis.get(self._redis_key(key))
+        except Exception as e:
+            logger.error(f"Cache {self.name} read failed for {key}: {e}")
+            cached = None
+        if cached is not None:
+            value = json.loads(cached)
+        else:
+            value = await loader()
+            try:
+                await redis.setex(self._redis_key(key), self.redis_ttl, json.dumps(value, default=str))
+            except Exception as e:
+                logger.error(f"Cache {self.name} write failed for {key}: {e}")
+        self.local.put(key, value)
+        return value
+
+    async def invalidate(self, redis, *keys: str):
+        for key in keys:
+            self.local.pop(key)
+        await redis.delete(*[self._redis_key(key) for key in keys])
+
+# Filter-bar reference data: ticket years and categories, the agent list
+reference_cache = TwoTierCache("reference")
+TICKET_YEARS_KEY = "ticket_years"
+TICKET_CATEGORIES_KEY = "ticket_categories"
+AGENTS_KEY = "agents"
@@ -0,0 +1,34 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.config import settings
+
+# Written only by the counter-maintaining code: if any ticket has one, that code has already
+# served traffic and comments.read_by_agent is no longer kept up to date
+MAINTAINED_COUNTER_QUERY = {"$or": [{"last_user_reply_at": {"$ne": None}}, {"last_read_at": {"$ne": None}}]}
+
+# One-off: seed tickets.unread_user_replies from comments still flagged read_by_agent=False.
+# Must run BEFORE the backend that maintains the counters serves traffic: after that,
+# mark-read no longer clears read_by_agent and every later reply would be counted twice.
+async def backfill_unread_counters():
+    client = AsyncIOMotorClient(settings.MONGO_URL)
+    db = client[settings.DB_NAME]
+
+    if await db.tickets.find_one(MAINTAINED_COUNTER_QUERY, {"_id": 1}):
+        print("Unread counters are already maintained by the running backend, refusing to backfill")
+        return
+
+    pipeline = [
+        {"$match": {"role": "user", "read_by_agent": False}},
+        {"$group": {"_id": "$ticket_id", "count": {"$sum": 1}, "last": {"$max": "$timestamp"}}}
+    ]
+    updated = 0
+    async for row in db.comments.aggregate(pipeline):
+        await db.tickets.update_one(
+            {"id": row["_id"]},
+            {"$set": {"unread_user_replies": row["count"], "last_user_reply_at": row["last"]}}
+        )
+        updated += 1
+    print(f"Backfilled unread counters on {updated} tickets")
+
+if __name__ == "__main__":
+    asyncio.run(backfill_unread_counters())
@@ -0,0 +1,19 @@
+import sys
+from app.core.api_keys import generate_api_key, hash_api_key, SERVICE_ROLES
+
+# Usage: python generate_api_key.py <name> [role]
+# Put the key in the client's env (e.g. BOT_API_KEY) and the entry in SERVICE_API_KEYS.
+# The Telegram bot only uses its key for its own calls (creating tickets, relaying user
+# replies, looking up a user's tickets), which the default "agent" role covers.
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python generate_api_key.py <name> [role]")
+        sys.exit(1)
+    name = sys.argv[1]
+    role = sys.argv[2] if len(sys.argv) > 2 else "agent"
+    if role not in SERVICE_ROLES:
+        print(f"Role must be one of {SERVICE_ROLES}")
+        sys.exit(1)
+    key = generate_api_key()
+    print(f"API key (give to the client): {key}")
+    print(f"SERVICE_API_KEYS entry: {name}:{role}:{hash_api_key(key)}")
@@ -0,0 +1,11 @@
+import asyncio
+from app.core.database import db, redis_client
+from app.services import ticket_facets
+
+# Recount the ticket year/category hashes behind /tickets/years and /tickets/categories
+async def main():
+    counts = await ticket_facets.rebuild(db, redis_client)
+    print(f"Rebuilt ticket facets: {counts['years']} years, {counts['categories']} categories")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,7 @@
 import pytest
 import pytest_asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
 from httpx import AsyncClient, ASGITransport
 from fastapi import FastAPI
 from app.main import app
@@ -52,3 +54,38 @@ async def authorized_client(async_client: AsyncClient, app: FastAPI):
 async def async_client():
     async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
         yield client
+
+@pytest_asyncio.fixture
+async def api_env(monkeypatch):
+    """Client against the real app with an in-memory Mongo and Redis.
+
+    Tests seed data through env.db / env.redis and may replace env.user (an agent by
+    default) before making requests. Notifications are published to a mocked Redis
+    client, whose pipeline is env.published.
+    """
+    fakeredis = pytest.importorskip("fakeredis")
+    from mongomock_motor import AsyncMongoMockClient
+    from app.core.database import get_db, get_redis
+    from app.routers import notifications
+
+    env = SimpleNamespace(
+        db=AsyncMongoMockClient()["test_db"],
+        redis=fakeredis.FakeAsyncRedis(decode_responses=True),
+        user=User(id="agent1", username="agent1", role="agent", status="approved")
+    )
+
+    publisher = MagicMock()
+    env.published = publisher.pipeline.return_value
+    env.published.__aenter__.return_value = env.published
+    env.published.execute = AsyncMock()
+    monkeypatch.setattr(notifications, "redis_client", publisher)
+
+    app.dependency_overrides[get_current_user] = lambda: env.user
+    app.dependency_overrides[get_db] = lambda: env.db
+    app.dependency_overrides[get_redis] = lambda: env.redis
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        env.client = client
+        yield env
+
+    app.dependency_overrides = {}
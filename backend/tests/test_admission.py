@@ -0,0 +1,40 @@
+import asyncio
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+from app.core.admission import AdmissionControlMiddleware, EndpointClass
+
+def make_app(release: asyncio.Event):
+    app = FastAPI()
+    app.add_middleware(AdmissionControlMiddleware, classes=[
+        EndpointClass("export", ["/export"], max_concurrent=1, max_queue=1, queue_timeout=0.05)
+    ])
+
+    @app.get("/export/report")
+    async def report():
+        await release.wait()
+        return {"ok": True}
+
+    @app.get("/tickets")
+    async def tickets():
+        return {"ok": True}
+
+    return app
+
+@pytest.mark.asyncio
+async def test_excess_requests_shed_with_retry_after():
+    release = asyncio.Event()
+    async with AsyncClient(transport=ASGITransport(app=make_app(release)), base_url="http://test") as client:
+        running = asyncio.create_task(client.get("/export/report"))
+        await asyncio.sleep(0.01)
+
+        queued, overflow = await asyncio.gather(client.get("/export/report"), client.get("/export/report"))
+        assert queued.status_code == overflow.status_code == 503
+        assert queued.headers["retry-after"] == "1"
+
+        # Other routes are not affected
+        assert (await client.get("/tickets")).status_code == 200
+
+        release.set()
+        assert (await running).status_code == 200
+        assert (await client.get("/export/report")).status_code == 200
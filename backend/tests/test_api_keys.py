@@ -0,0 +1,41 @@
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient, ASGITransport
+from mongomock_motor import AsyncMongoMockClient
+from app.main import app
+from app.core import api_keys
+from app.core.config import settings
+from app.core.database import get_db
+
+@pytest_asyncio.fixture
+async def client(monkeypatch):
+    key = api_keys.generate_api_key()
+    monkeypatch.setattr(settings, "SERVICE_API_KEYS", [
+        f"telegram-bot:admin:{api_keys.hash_api_key(key)}",
+        "malformed-entry"
+    ])
+    api_keys.load_service_keys()
+    db = AsyncMongoMockClient()["test_db"]
+    app.dependency_overrides[get_db] = lambda: db
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client, key
+
+    app.dependency_overrides = {}
+    monkeypatch.setattr(settings, "SERVICE_API_KEYS", [])
+    api_keys.load_service_keys()
+
+@pytest.mark.asyncio
+async def test_service_api_key_authenticates_without_token(client):
+    client, key = client
+    response = await client.get("/api/tickets/unread-replies", headers={"X-API-Key": key})
+    assert response.status_code == 200
+    assert api_keys.get_service_account(key).role == "admin"
+
+@pytest.mark.asyncio
+async def test_unknown_api_key_rejected(client):
+    client, _ = client
+    response = await client.get("/api/tickets/unread-replies", headers={"X-API-Key": "sdv_wrong"})
+    assert response.status_code == 401
+    response = await client.get("/api/tickets/unread-replies")
+    assert response.status_code == 403
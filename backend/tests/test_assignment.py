@@ -0,0 +1,161 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock
+from mongomock_motor import AsyncMongoMockClient
+from app.core.config import settings
+from app.models.user import User
+from app.routers import notifications
+from app.services import assignment, presence
+
+fakeredis = pytest.importorskip("fakeredis")
+
+@pytest_asyncio.fixture
+async def env(monkeypatch):
+    monkeypatch.setattr(notifications, "publish", AsyncMock())
+    monkeypatch.setattr(notifications, "publish_many", AsyncMock())
+    monkeypatch.setattr(assignment, "notify_ticket_claimed", AsyncMock())
+    monkeypatch.setattr(settings, "MAX_TICKETS_PER_AGENT", 2)
+    db = AsyncMongoMockClient()["test_db"]
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    return db, redis
+
+async def create_open_tickets(db, count):
+    ids = [f"t{i}" for i in range(count)]
+    for ticket_id in ids:
+        await db.tickets.insert_one({"id": ticket_id, "ticket_number": f"INC{ticket_id}", "status": "open", "assigned_agent": None})
+    return ids
+
+@pytest.mark.asyncio
+async def test_round_robin_then_queue_then_refill(env):
+    db, redis = env
+    for agent_id in ["a1", "a2"]:
+        await assignment.go_online(User(id=agent_id, username=agent_id, role="agent"), db, redis)
+    ids = await create_open_tickets(db, 5)
+
+    results = [await assignment.assign_new_ticket(ticket_id, db, redis) for ticket_id in ids]
+
+    assert results[:4] in (["a1", "a2", "a1", "a2"], ["a2", "a1", "a2", "a1"])
+    assert results[4] is None
+    assert await redis.lrange(assignment.QUEUE_KEY, 0, -1) == ["t4"]
+
+    await db.tickets.update_one({"id": "t0"}, {"$set": {"status": "completed"}})
+    await assignment.release_slot(results[0], db, redis)
+
+    refilled = await db.tickets.find_one({"id": "t4"})
+    assert refilled["assigned_agent"] == results[0]
+    assert refilled["status"] == "in_progress"
+    assert await redis.llen(assignment.QUEUE_KEY) == 0
+
+@pytest.mark.asyncio
+async def test_concurrent_burst_never_exceeds_capacity(env):
+    db, redis = env
+    for agent_id in ["a1", "a2"]:
+        await assignment.go_online(User(id=agent_id, username=agent_id, role="agent"), db, redis)
+    ids = await create_open_tickets(db, 10)
+
+    results = await asyncio.gather(*(assignment.assign_new_ticket(t, db, redis) for t in ids))
+
+    assert sorted(r for r in results if r) == ["a1", "a1", "a2", "a2"]
+    assert await redis.llen(assignment.QUEUE_KEY) == 6
+    workload = await assignment.get_workload(redis)
+    assert [a["active_tickets"] for a in workload["agents"]] == [2, 2]
+
+@pytest.mark.asyncio
+async def test_stale_queue_entry_is_skipped(env):
+    db, redis = env
+    await create_open_tickets(db, 2)
+    await assignment.assign_new_ticket("t0", db, redis)
+    await assignment.assign_new_ticket("t1", db, redis)
+    # t0 was picked up by hand while queued
+    await db.tickets.update_one({"id": "t0"}, {"$set": {"assigned_agent": "x", "status": "in_progress"}})
+
+    await assignment.go_online(User(id="a1", username="a1", role="agent"), db, redis)
+
+    assert (await db.tickets.find_one({"id": "t1"}))["assigned_agent"] == "a1"
+    workload = await assignment.get_workload(redis)
+    assert workload["agents"][0]["active_tickets"] == 1
+    assert workload["queued_tickets"] == 0
+
+@pytest.mark.asyncio
+async def test_agents_without_presence_are_skipped_until_they_return(env):
+    db, redis = env
+    for agent_id in ["a1", "a2"]:
+        await assignment.go_online(User(id=agent_id, username=agent_id, role="agent"), db, redis)
+    await redis.zrem(presence.online_key("agent"), "a1")
+    ids = await create_open_tickets(db, 3)
+
+    results = [await assignment.assign_new_ticket(ticket_id, db, redis) for ticket_id in ids[:2]]
+
+    assert results == ["a2", "a2"]
+    assert await redis.zrange(assignment.POOL_KEY, 0, -1) == ["a1", "a2"]
+    assert [a["online"] for a in (await assignment.get_workload(redis))["agents"]] == [False, True]
+
+    await presence.heartbeat(User(id="a1", username="a1", role="agent"), redis)
+    assert await assignment.assign_new_ticket(ids[2], db, redis) == "a1"
+
+@pytest.mark.asyncio
+async def test_full_queue_leaves_ticket_open(env, monkeypatch):
+    db, redis = env
+    monkeypatch.setattr(settings, "ASSIGNMENT_QUEUE_MAX", 2)
+    ids = await create_open_tickets(db, 3)
+
+    results = [await assignment.assign_new_ticket(ticket_id, db, redis) for ticket_id in ids]
+
+    assert results == [None, None, None]
+    assert await redis.lrange(assignment.QUEUE_KEY, 0, -1) == ["t0", "t1"]
+    assert (await db.tickets.find_one({"id": "t2"}))["status"] == "open"
+
+@pytest.mark.asyncio
+async def test_first_socket_heartbeat_joins_the_pool(env, monkeypatch):
+    db, redis = env
+    monkeypatch.setattr(notifications, "db", db)
+    monkeypatch.setattr(notifications, "redis_client", redis)
+    await create_open_tickets(db, 1)
+    await assignment.assign_new_ticket("t0", db, redis)
+    agent = User(id="a1", username="a1", role="agent")
+
+    await notifications.record_heartbeat(notifications.ClientConnection(None, "a1"), agent)
+
+    assert await redis.zrange(assignment.POOL_KEY, 0, -1) == ["a1"]
+    assert (await db.tickets.find_one({"id": "t0"}))["assigned_agent"] == "a1"
+
+@pytest.mark.asyncio
+async def test_unassigned_ticket_not_handed_back_to_releasing_agent(env):
+    db, redis = env
+    await assignment.go_online(User(id="a1", username="a1", role="agent"), db, redis)
+    await create_open_tickets(db, 2)
+
+    # a1 is the only agent online: the ticket waits instead of going straight back
+    assert await assignment.assign_new_ticket("t0", db, redis, exclude_agent="a1") is None
+    assert (await db.tickets.find_one({"id": "t0"}))["assigned_agent"] is None
+
+    # a1 still ranks first, but the excluded ticket goes to a2
+    await redis.delete(assignment.QUEUE_KEY)
+    await assignment.go_online(User(id="a2", username="a2", role="agent"), db, redis)
+    assert await assignment.assign_new_ticket("t1", db, redis, exclude_agent="a1") == "a2"
+
+@pytest.mark.asyncio
+async def test_batch_assignment_fills_slots_then_queues(env, monkeypatch):
+    db, redis = env
+    for agent_id in ["a1", "a2"]:
+        await assignment.go_online(User(id=agent_id, username=agent_id, role="agent"), db, redis)
+    ids = await create_open_tickets(db, 5)
+    await db.tickets.update_one({"id": "t1"}, {"$set": {"assigned_agent": "x", "status": "in_progress"}})
+    script = assignment._release_and_drain_script
+    calls = []
+
+    async def counting_script(**kwargs):
+        calls.append(kwargs)
+        return await script(**kwargs)
+
+    monkeypatch.setattr(assignment, "_release_and_drain_script", counting_script)
+
+    applied = await assignment.assign_new_tickets(ids, db, redis)
+
+    # t1 was claimed by hand: its slot is handed back and goes to the queued ticket
+    assert sorted(applied) == ["t0", "t2", "t3", "t4"]
+    assert sorted(applied.values()) == ["a1", "a1", "a2", "a2"]
+    assert len(calls) == 2
+    assert await redis.llen(assignment.QUEUE_KEY) == 0
+    notifications.publish_many.assert_awaited()
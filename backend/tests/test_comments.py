@@ -0,0 +1,64 @@
+import json
+import pytest
+import pytest_asyncio
+from app.routers import notifications
+
+@pytest_asyncio.fixture
+async def client_and_db(api_env):
+    await api_env.db.tickets.insert_one({"id": "t1", "ticket_number": "INC1", "status": "in_progress", "user_telegram_id": None})
+    return api_env.client, api_env.db
+
+@pytest.mark.asyncio
+async def test_new_comment_pushed_to_ticket_topic(client_and_db):
+    client, _ = client_and_db
+
+    response = await client.post("/api/tickets/t1/comments", json={"comment": "halo"})
+    assert response.status_code == 200
+
+    channel, payload = notifications.redis_client.pipeline.return_value.publish.call_args.args
+    event = json.loads(payload)
+    assert event["topics"] == ["ticket:t1"]
+    assert event["message"]["type"] == "new_comment"
+    assert event["message"]["data"]["id"] == response.json()["id"]
+
+@pytest.mark.asyncio
+async def test_get_comments_since_cursor(client_and_db):
+    client, db = client_and_db
+    for i, ts in enumerate(["2025-01-01T10:00:00+00:00", "2025-01-01T10:00:05.500000+00:00", "2025-01-01T10:01:00+00:00"]):
+        await db.comments.insert_one({
+            "id": f"c{i}", "ticket_id": "t1", "user_id": "u", "username": "u",
+            "role": "user", "comment": str(i), "timestamp": ts
+        })
+
+    response = await client.get("/api/tickets/t1/comments", params={"since": "2025-01-01T10:00:05.500000Z"})
+    assert response.status_code == 200
+    assert [c["id"] for c in response.json()] == ["c2"]
+
+    response = await client.get("/api/tickets/t1/comments")
+    assert [c["id"] for c in response.json()] == ["c0", "c1", "c2"]
+
+    response = await client.get("/api/tickets/t1/comments", params={"since": "not-a-date"})
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_unread_counter_lifecycle(client_and_db):
+    client, db = client_and_db
+    for text in ["satu", "dua"]:
+        response = await client.post("/api/tickets/bot-comments", json={
+            "ticket_number": "INC1", "user_telegram_id": "u1", "user_telegram_name": "User", "comment": text
+        })
+        assert response.status_code == 200
+
+    ticket = await db.tickets.find_one({"id": "t1"})
+    assert ticket["unread_user_replies"] == 2
+    assert ticket["last_user_reply_at"] is not None
+
+    response = await client.get("/api/tickets/unread-replies")
+    assert response.json() == {"ticket_ids": ["t1"]}
+
+    response = await client.put("/api/tickets/t1/mark-read")
+    assert response.json()["count"] == 2
+
+    response = await client.get("/api/tickets/unread-replies")
+    assert response.json() == {"ticket_ids": []}
+    assert (await db.tickets.find_one({"id": "t1"}))["last_read_at"] is not None
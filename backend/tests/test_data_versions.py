@@ -0,0 +1,33 @@
+import pytest
+from app.services import data_versions
+
+fakeredis = pytest.importorskip("fakeredis")
+
+def test_ticket_scopes():
+    ticket = {"created_at": "2025-03-31T23:30:00-02:00", "assigned_agent": "a2"}
+    assert data_versions.ticket_scopes(ticket, "a1", "a2") == [
+        "global", "month:2025-04", "agent:a2", "agent:a1"
+    ]
+
+def test_report_month_matches_invalidated_scope():
+    from app.routers.performance import filter_scope, filter_tickets
+
+    ticket = {"created_at": "2025-03-31T23:30:00-02:00", "category": "HSI"}
+    [scope] = [s for s in data_versions.ticket_scopes(ticket) if s.startswith("month:")]
+
+    assert filter_tickets([ticket], "2025", "4", None, None) == [ticket]
+    assert filter_tickets([ticket], "2025", "3", None, None) == []
+    assert filter_scope("2025", "4", None) == scope
+
+@pytest.mark.asyncio
+async def test_bump_changes_only_dependent_keys():
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    march = data_versions.month_scope(2025, 3)
+    april = data_versions.month_scope(2025, 4)
+    march_key = await data_versions.cache_key(redis, "report", [march], category="HSI")
+    april_key = await data_versions.cache_key(redis, "report", [april], category="HSI")
+
+    await data_versions.bump(redis, [data_versions.GLOBAL_SCOPE, april])
+
+    assert await data_versions.cache_key(redis, "report", [march], category="HSI") == march_key
+    assert await data_versions.cache_key(redis, "report", [april], category="HSI") != april_key
@@ -0,0 +1,55 @@
+import threading
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+from app.core import metrics
+from app.core.metrics import Histogram, HTTP_REQUEST_SECONDS, RouteTimer, render_metrics
+
+def make_app():
+    app = FastAPI()
+    app.add_middleware(RouteTimer)
+
+    @app.get("/tickets/{ticket_id}")
+    async def get_ticket(ticket_id: str):
+        return {"id": ticket_id}
+
+    return app
+
+@pytest.mark.asyncio
+async def test_latency_recorded_per_route_template():
+    async with AsyncClient(transport=ASGITransport(app=make_app()), base_url="http://test") as client:
+        await client.get("/tickets/a")
+        await client.get("/tickets/b")
+        await client.get("/nope")
+
+    assert HTTP_REQUEST_SECONDS.count(method="GET", route="/tickets/{ticket_id}", status="200") == 2
+    assert HTTP_REQUEST_SECONDS.count(method="GET", route="unmatched", status="404") == 1
+
+def test_histogram_renders_cumulative_buckets():
+    latency = Histogram("test_latency_seconds", "Test", ["op"], buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, op="read")
+
+    text = render_metrics()
+    assert "# TYPE test_latency_seconds histogram" in text
+    assert 'test_latency_seconds_bucket{op="read",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{op="read",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{op="read",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{op="read"} 3' in text
+
+def test_concurrent_observations_are_not_lost():
+    histogram = Histogram("test_threaded_seconds", "Observed from many threads", ["worker"])
+    metrics._registry.remove(histogram)
+
+    def observe_many(worker):
+        for _ in range(2000):
+            histogram.observe(0.01, worker=str(worker % 3))
+            histogram.render()
+
+    threads = [threading.Thread(target=observe_many, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(histogram.count(worker=str(w)) for w in range(3)) == 8 * 2000
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, MagicMock
+from app.routers import notifications
+from app.routers.notifications import ConnectionManager, SEND_QUEUE_SIZE
+
+def mock_redis_pipeline():
+    mock_redis = MagicMock()
+    pipe = mock_redis.pipeline.return_value
+    pipe.__aenter__.return_value = pipe
+    pipe.execute = AsyncMock()
+    return mock_redis, pipe
+
+class FakeWebSocket:
+    def __init__(self, stalled: bool = False):
+        self.sent = []
+        self.closed_code = None
+        self.stalled = stalled
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, payload: str):
+        if self.stalled:
+            await asyncio.Event().wait()
+        self.sent.append(payload)
+
+    async def close(self, code: int = 1000):
+        self.closed_code = code
+
+@pytest_asyncio.fixture
+async def manager(monkeypatch):
+    """A fresh manager per test, installed as the module manager; every writer task it starts is awaited on teardown"""
+    manager = ConnectionManager()
+    monkeypatch.setattr(notifications, "manager", manager)
+    writers = []
+    connect = manager.connect
+
+    async def tracked_connect(*args, **kwargs):
+        conn = await connect(*args, **kwargs)
+        writers.append(conn.writer_task)
+        return conn
+
+    monkeypatch.setattr(manager, "connect", tracked_connect)
+    yield manager
+    for websocket in list(manager.active_connections):
+        manager.disconnect(websocket)
+    await asyncio.gather(*writers, return_exceptions=True)
+
+@pytest.mark.asyncio
+async def test_broadcast_not_blocked_by_stalled_socket(manager):
+    fast = FakeWebSocket()
+    slow = FakeWebSocket(stalled=True)
+    await manager.connect(fast, "fast")
+    await manager.connect(slow, "slow")
+
+    await asyncio.wait_for(manager.broadcast({"type": "new_ticket", "data": {}}), timeout=1)
+    await asyncio.sleep(0)
+
+    assert [json.loads(p)["type"] for p in fast.sent] == ["new_ticket"]
+    assert slow.sent == []
+
+@pytest.mark.asyncio
+async def test_slow_consumer_evicted_on_overflow(manager):
+    slow = FakeWebSocket(stalled=True)
+    await manager.connect(slow, "slow")
+
+    for i in range(SEND_QUEUE_SIZE + 2):
+        await manager.broadcast({"type": "new_reply", "data": {"n": i}})
+    await asyncio.sleep(0)
+
+    assert slow not in manager.active_connections
+    assert "slow" not in manager.user_connections
+    assert slow.closed_code == 1013
+
+@pytest.mark.asyncio
+async def test_publish_goes_through_redis_channel(monkeypatch):
+    mock_redis, pipe = mock_redis_pipeline()
+    monkeypatch.setattr(notifications, "redis_client", mock_redis)
+
+    await notifications.notify_new_reply("t1", "INC1", "@user")
+
+    channel, payload = pipe.publish.call_args.args
+    assert channel == notifications.NOTIFICATION_CHANNEL
+    event = json.loads(payload)
+    assert event["message"]["data"]["ticket_id"] == "t1"
+    assert notifications.ticket_topic("t1") in event["topics"]
+
+@pytest.mark.asyncio
+async def test_publish_falls_back_to_local_sockets(monkeypatch, manager):
+    mock_redis, pipe = mock_redis_pipeline()
+    pipe.execute.side_effect = ConnectionError("redis down")
+    monkeypatch.setattr(notifications, "redis_client", mock_redis)
+    ws = FakeWebSocket()
+    await manager.connect(ws, "agent", [notifications.AGENTS_TOPIC])
+
+    await notifications.notify_new_ticket({"id": "t1"})
+    await asyncio.sleep(0)
+
+    assert json.loads(ws.sent[0])["type"] == "new_ticket"
+
+@pytest.mark.asyncio
+async def test_events_routed_by_topic(manager):
+    from app.models.user import User
+
+    assigned, other, admin = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    second_tab = FakeWebSocket()
+    await manager.connect(assigned, "a1", notifications.default_topics(User(id="a1", username="a1", role="agent")))
+    await manager.connect(second_tab, "a1", notifications.default_topics(User(id="a1", username="a1", role="agent")))
+    await manager.connect(other, "a2", notifications.default_topics(User(id="a2", username="a2", role="agent")))
+    await manager.connect(admin, "ad", notifications.default_topics(User(id="ad", username="ad", role="admin")))
+
+    topics = [notifications.user_topic("a1"), notifications.ADMINS_TOPIC, notifications.ticket_topic("t1")]
+    manager.send_to_topics(topics, '{"type": "new_reply"}')
+    await asyncio.sleep(0)
+
+    assert len(assigned.sent) == len(second_tab.sent) == len(admin.sent) == 1
+    assert other.sent == []
+
+@pytest.mark.asyncio
+async def test_client_can_follow_a_ticket(manager):
+    ws = FakeWebSocket()
+    conn = await manager.connect(ws, "u1")
+    notifications.handle_client_message(conn, json.dumps({"action": "subscribe", "topic": "ticket:t1"}))
+    notifications.handle_client_message(conn, json.dumps({"action": "subscribe", "topic": "admins"}))
+
+    assert conn.topics == {"ticket:t1"}
+    manager.disconnect(ws)
+    assert "ticket:t1" not in manager.topic_connections
+
+class FakeRequest:
+    def __init__(self, reads_before_disconnect: int):
+        self.remaining = reads_before_disconnect
+
+    async def is_disconnected(self):
+        self.remaining -= 1
+        return self.remaining < 0
+
+@pytest.mark.asyncio
+async def test_sse_replays_from_last_event_id_filtered_by_topic():
+    redis = AsyncMock()
+    redis.xrange.return_value = [("100-0", {})]
+    redis.xread.return_value = [(notifications.EVENT_STREAM_KEY, [
+        ("105-0", {"topics": json.dumps(["admins"]), "message": '{"type": "new_ticket"}'}),
+        ("106-0", {"topics": json.dumps(["user:a1"]), "message": '{"type": "new_reply"}'}),
+    ])]
+
+    frames = [f async for f in notifications.sse_events(FakeRequest(1), redis, {"user:a1"}, "104-0")]
+
+    assert frames == ['id: 106-0\ndata: {"type": "new_reply"}\n\n']
+    assert redis.xread.call_args.args[0] == {notifications.EVENT_STREAM_KEY: "104-0"}
+
+@pytest.mark.asyncio
+async def test_sse_signals_resync_when_history_trimmed():
+    redis = AsyncMock()
+    redis.xrange.return_value = [("200-0", {})]
+    redis.xread.return_value = []
+
+    frames = [f async for f in notifications.sse_events(FakeRequest(1), redis, {"admins"}, "150-3")]
+
+    assert json.loads(frames[0].removeprefix("data: "))["type"] == "resync"
+    assert frames[1] == ": keepalive\n\n"
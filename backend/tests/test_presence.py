@@ -0,0 +1,27 @@
+import pytest
+from app.models.user import User
+from app.services import presence
+
+fakeredis = pytest.importorskip("fakeredis")
+
+@pytest.mark.asyncio
+async def test_heartbeat_marks_user_online_per_role():
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    await presence.heartbeat(User(id="a1", username="a1", role="agent"), redis)
+    await presence.heartbeat(User(id="ad", username="ad", role="admin"), redis)
+
+    assert await presence.get_online("agent", redis) == ["a1"]
+    assert await presence.is_online("a1", redis)
+    assert 0 < await redis.ttl(presence.presence_key("a1")) <= presence.PRESENCE_TTL_SECONDS
+
+@pytest.mark.asyncio
+async def test_stale_heartbeats_drop_out(monkeypatch):
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    await presence.heartbeat(User(id="a1", username="a1", role="agent"), redis)
+
+    later = presence._now_ms() + (presence.PRESENCE_TTL_SECONDS + 1) * 1000
+    monkeypatch.setattr(presence, "_now_ms", lambda: later)
+    assert await presence.get_online("agent", redis) == []
+
+    await presence.heartbeat(User(id="a2", username="a2", role="agent"), redis)
+    assert await redis.zrange(presence.online_key("agent"), 0, -1) == ["a2"]
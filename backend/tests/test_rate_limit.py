@@ -0,0 +1,47 @@
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient, ASGITransport
+from mongomock_motor import AsyncMongoMockClient
+from app.main import app
+from app.core import rate_limit
+from app.core.database import get_db, get_redis
+
+fakeredis = pytest.importorskip("fakeredis")
+
+@pytest.mark.asyncio
+async def test_costs_share_one_sliding_budget(monkeypatch):
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(rate_limit.time, "time", lambda: 1000.0)
+
+    assert (await rate_limit.hit(redis, "analytics", "u1", 20, 50, 60))[0]
+    assert (await rate_limit.hit(redis, "analytics", "u1", 20, 50, 60))[0]
+    allowed, retry_after = await rate_limit.hit(redis, "analytics", "u1", 20, 50, 60)
+    assert not allowed and retry_after > 0
+    # Budgets are per identity
+    assert (await rate_limit.hit(redis, "analytics", "u2", 20, 50, 60))[0]
+
+    # Halfway through the next window, half of the previous window still counts
+    monkeypatch.setattr(rate_limit.time, "time", lambda: 1050.0)
+    assert (await rate_limit.hit(redis, "analytics", "u1", 20, 50, 60))[0]
+    assert not (await rate_limit.hit(redis, "analytics", "u1", 20, 50, 60))[0]
+
+@pytest_asyncio.fixture
+async def client():
+    db = AsyncMongoMockClient()["test_db"]
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_redis] = lambda: redis
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+    app.dependency_overrides = {}
+
+@pytest.mark.asyncio
+async def test_login_limited_per_ip(client):
+    statuses = [
+        (await client.post("/api/auth/login", json={"username": "nobody", "password": "x"})).status_code
+        for _ in range(6)
+    ]
+    assert statuses[:5] == [401] * 5
+    assert statuses[5] == 429
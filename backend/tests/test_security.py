@@ -0,0 +1,34 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app.core import security
+from app.core.config import settings
+
+@pytest.mark.asyncio
+async def test_hashing_runs_off_the_event_loop():
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.001)
+
+    task = asyncio.create_task(ticker())
+    hashed = await security.get_password_hash("rahasia123")
+    assert await security.verify_password("rahasia123", hashed)
+    assert not await security.verify_password("salah", hashed)
+    task.cancel()
+
+    assert ticks > 5
+    assert security.hash_stats.completed >= 3
+    assert security.hash_stats.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_hashing_rejected_over_cap(monkeypatch):
+    monkeypatch.setattr(settings, "PASSWORD_HASH_MAX_PENDING", 0)
+    rejected = security.hash_stats.rejected
+    with pytest.raises(HTTPException) as exc:
+        await security.get_password_hash("rahasia123")
+    assert exc.value.status_code == 503
+    assert security.hash_stats.rejected == rejected + 1
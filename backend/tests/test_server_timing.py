@@ -0,0 +1,43 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+from app.core.database import CommandTimer, InstrumentedRedis
+from app.core.metrics import RouteTimer
+
+aioredis = pytest.importorskip("fakeredis").aioredis
+
+def make_app():
+    app = FastAPI()
+    app.add_middleware(RouteTimer)
+    redis = InstrumentedRedis(connection_pool=aioredis.FakeRedis(decode_responses=True).connection_pool)
+    listener = CommandTimer()
+
+    @app.get("/tickets/{ticket_id}")
+    async def get_ticket(ticket_id: str):
+        await redis.set(f"ticket:{ticket_id}", "1")
+        async with redis.pipeline() as pipe:
+            pipe.get(f"ticket:{ticket_id}")
+            pipe.incr("views")
+            await pipe.execute()
+        # Motor reports commands from its executor threads, with the request context copied
+        for _ in range(3):
+            event = SimpleNamespace(command_name="find", duration_micros=2000)
+            await asyncio.to_thread(listener.succeeded, event)
+        return {"id": ticket_id}
+
+    return app
+
+@pytest.mark.asyncio
+async def test_round_trips_reported_in_server_timing():
+    async with AsyncClient(transport=ASGITransport(app=make_app()), base_url="http://test") as client:
+        response = await client.get("/tickets/abc")
+
+    assert response.status_code == 200
+    metrics = {part.split(";")[0]: part for part in response.headers["server-timing"].split(", ")}
+    assert metrics["mongo"] == 'mongo;desc="3 calls";dur=6.0'
+    # The pipeline is a single round trip
+    assert metrics["redis"].startswith('redis;desc="2 calls"')
+    assert "app" in metrics
+    assert "timing-allow-origin" in response.headers
@@ -0,0 +1,82 @@
+import pytest
+from types import SimpleNamespace
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+from app.core.metrics import RouteTimer
+from app.core.request_context import current_route
+from app.core.slow_queries import SlowQueryLog, query_shape
+
+def command_events(command_name, command, duration_ms, request_id=1):
+    fields = dict(command_name=command_name, request_id=request_id, connection_id=("db", 27017),
+                  operation_id=request_id, database_name="test_db")
+    return (SimpleNamespace(command=command, **fields),
+            SimpleNamespace(duration_micros=int(duration_ms * 1000), **fields))
+
+def test_shape_masks_literal_values():
+    a = query_shape("find", {"find": "tickets", "filter": {"status": "open", "id": {"$in": [1, 2, 3]}}})
+    b = query_shape("find", {"find": "tickets", "filter": {"status": "closed", "id": {"$in": [4]}}})
+    assert a == b
+    assert "open" not in a
+
+def test_slow_commands_grouped_by_shape():
+    log = SlowQueryLog(threshold_ms=50, explain=False)
+    for i, (status, duration) in enumerate([("open", 80), ("closed", 120), ("open", 10)]):
+        started, finished = command_events("find", {"find": "tickets", "filter": {"status": status}}, duration, request_id=i)
+        log.started(started)
+        log.succeeded(finished)
+
+    report = log.report()
+    assert len(report["shapes"]) == 1
+    shape = report["shapes"][0]
+    assert shape["count"] == 2
+    assert shape["max_ms"] == 120
+    assert shape["routes"] == ["background"]
+    assert len(report["recent"]) == 2
+
+@pytest.mark.asyncio
+async def test_route_attribution_from_request_context():
+    app = FastAPI()
+    app.add_middleware(RouteTimer)
+
+    @app.get("/tickets/{ticket_id}")
+    async def get_ticket(ticket_id: str):
+        return {"route": current_route()}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/tickets/abc")
+    assert response.json()["route"] == "/tickets/{ticket_id}"
+    assert current_route() is None
+
+class FakeExplainClient:
+    def __init__(self, stage):
+        self.stage = stage
+        self.commands = []
+
+    def __getitem__(self, name):
+        return self
+
+    async def command(self, command):
+        self.commands.append(command)
+        return {"queryPlanner": {
+            "winningPlan": {"stage": "FETCH", "inputStage": {"stage": self.stage}},
+            "rejectedPlans": [{"stage": "COLLSCAN"}]
+        }}
+
+@pytest.mark.asyncio
+async def test_new_shapes_explained_and_collscan_flagged():
+    log = SlowQueryLog(threshold_ms=0, explain=True)
+    started, finished = command_events("find", {"find": "tickets", "filter": {"category": "x"}, "lsid": {"id": 1}}, 5)
+    log.started(started)
+    log.succeeded(finished)
+
+    client = FakeExplainClient("COLLSCAN")
+    await log.explain_pending(client)
+    assert client.commands[0]["explain"] == {"find": "tickets", "filter": {"category": "x"}}
+    assert log.report()["shapes"][0]["collscan"] is True
+
+    # An index scan in the winning plan is not flagged, whatever the rejected plans did
+    log.clear()
+    log.started(started)
+    log.succeeded(finished)
+    await log.explain_pending(FakeExplainClient("IXSCAN"))
+    assert log.report()["shapes"][0]["collscan"] is False
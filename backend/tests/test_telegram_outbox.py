@@ -0,0 +1,67 @@
+import pytest
+import pytest_asyncio
+from app.core.config import settings
+from app.models.user import User
+
+@pytest_asyncio.fixture
+async def client_and_db(api_env):
+    await api_env.db.tickets.insert_one({
+        "id": "t1", "ticket_number": "INC1", "status": "in_progress",
+        "user_telegram_id": "111", "user_telegram_name": "Budi"
+    })
+    api_env.user = User(id="admin1", username="admin", role="admin", status="approved")
+    return api_env.client, api_env.db
+
+@pytest.mark.asyncio
+async def test_pending_telegram_joins_ticket(client_and_db):
+    client, _ = client_and_db
+    await client.post("/api/tickets/t1/comments", json={"comment": "halo"})
+
+    response = await client.get("/api/tickets/comments/pending-telegram")
+    [item] = response.json()
+    assert item["ticket_number"] == "INC1"
+    assert item["user_telegram_id"] == "111"
+    assert item["comment"] == "halo"
+
+@pytest.mark.asyncio
+async def test_outbox_not_fed_unless_enabled(client_and_db):
+    client, _ = client_and_db
+    await client.post("/api/tickets/t1/comments", json={"comment": "halo"})
+
+    assert (await client.get("/api/tickets/comments/telegram-outbox", params={"block_ms": 0})).json() == []
+
+@pytest.mark.asyncio
+async def test_outbox_batch_read_and_ack(client_and_db, monkeypatch):
+    client, db = client_and_db
+    monkeypatch.setattr(settings, "TELEGRAM_OUTBOX_ENABLED", True)
+    for text in ["satu", "dua", "tiga"]:
+        await client.post("/api/tickets/t1/comments", json={"comment": text})
+
+    batch = (await client.get("/api/tickets/comments/telegram-outbox", params={"count": 2, "block_ms": 0})).json()
+    assert [item["comment"] for item in batch] == ["satu", "dua"]
+
+    # Unacknowledged entries are redelivered first
+    again = (await client.get("/api/tickets/comments/telegram-outbox", params={"count": 2, "block_ms": 0})).json()
+    assert [item["stream_id"] for item in again] == [item["stream_id"] for item in batch]
+
+    response = await client.post("/api/tickets/comments/telegram-outbox/ack", json={
+        "comment_ids": [item["comment_id"] for item in batch],
+        "stream_ids": [item["stream_id"] for item in batch]
+    })
+    assert response.json()["count"] == 2
+    assert await db.comments.count_documents({"sent_to_telegram": True}) == 2
+
+    rest = (await client.get("/api/tickets/comments/telegram-outbox", params={"block_ms": 0})).json()
+    assert [item["comment"] for item in rest] == ["tiga"]
+
+@pytest.mark.asyncio
+async def test_outbox_requires_staff_and_valid_params(client_and_db, api_env):
+    client, _ = client_and_db
+
+    assert (await client.get("/api/tickets/comments/telegram-outbox", params={"block_ms": -1})).status_code == 400
+    assert (await client.get("/api/tickets/comments/telegram-outbox", params={"count": 0})).status_code == 400
+
+    api_env.user = User(id="u1", username="u1", role="user", status="approved")
+    assert (await client.get("/api/tickets/comments/telegram-outbox", params={"block_ms": 0})).status_code == 403
+    response = await client.post("/api/tickets/comments/telegram-outbox/ack", json={"comment_ids": [], "stream_ids": []})
+    assert response.status_code == 403
@@ -0,0 +1,17 @@
+import pytest
+
+@pytest.mark.asyncio
+async def test_telegram_user_active_tickets(api_env):
+    client, db = api_env.client, api_env.db
+    for i, status in enumerate(["open", "completed", "pending", "completed"]):
+        await db.tickets.insert_one({
+            "id": f"u{i}", "ticket_number": f"INC-U{i}", "status": status,
+            "user_telegram_id": "222", "created_at": f"2025-01-0{i + 1}T00:00:00+00:00"
+        })
+
+    response = await client.get("/api/tickets/telegram-user/222", params={"completed_limit": 1})
+    body = response.json()
+    assert body["active_count"] == 2
+    assert [t["ticket_number"] for t in body["active"]] == ["INC-U2", "INC-U0"]
+    assert [t["ticket_number"] for t in body["completed"]] == ["INC-U3"]
+    assert set(body["active"][0]) == {"id", "ticket_number", "status", "created_at"}
@@ -0,0 +1,47 @@
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from app.services import ticket_facets
+from app.services.two_tier_cache import reference_cache
+
+fakeredis = pytest.importorskip("fakeredis")
+
+@pytest.fixture(autouse=True)
+def clear_local_cache():
+    reference_cache.local.clear()
+
+@pytest.mark.asyncio
+async def test_facets_rebuilt_when_missing_then_maintained():
+    db = AsyncMongoMockClient()["test_db"]
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    await db.tickets.insert_many([
+        {"id": "t1", "category": "HSI", "created_at": "2024-05-01T00:00:00+00:00"},
+        {"id": "t2", "category": "VPN IP", "created_at": "2025-01-01T00:00:00+00:00"},
+    ])
+
+    assert await ticket_facets.get_years(db, redis) == [2025, 2024]
+    assert await ticket_facets.get_categories(db, redis) == ["HSI", "VPN IP"]
+
+    new_ticket = {"id": "t3", "category": "QC2", "created_at": "2026-02-01T00:00:00+00:00"}
+    await ticket_facets.record_created([new_ticket], redis)
+    assert await ticket_facets.get_years(db, redis) == [2026, 2025, 2024]
+
+    await ticket_facets.record_deleted({"category": "VPN IP", "created_at": "2025-01-01T00:00:00+00:00"}, redis)
+    assert await ticket_facets.get_categories(db, redis) == ["HSI", "QC2"]
+    assert await ticket_facets.get_years(db, redis) == [2026, 2024]
+
+@pytest.mark.asyncio
+async def test_create_before_first_read_does_not_hide_existing_values():
+    db = AsyncMongoMockClient()["test_db"]
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    await db.tickets.insert_many([
+        {"id": "t1", "category": "HSI", "created_at": "2024-05-01T00:00:00+00:00"},
+        {"id": "t2", "category": "VPN IP", "created_at": "2025-01-01T00:00:00+00:00"},
+    ])
+
+    # Fresh deploy or flushed Redis: a ticket is created before anyone reads the lists
+    new_ticket = {"id": "t3", "category": "QC2", "created_at": "2026-02-01T00:00:00+00:00"}
+    await db.tickets.insert_one(dict(new_ticket))
+    await ticket_facets.record_created([new_ticket], redis)
+
+    assert await ticket_facets.get_years(db, redis) == [2026, 2025, 2024]
+    assert await ticket_facets.get_categories(db, redis) == ["HSI", "QC2", "VPN IP"]
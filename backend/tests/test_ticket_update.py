@@ -0,0 +1,51 @@
+import asyncio
+import pytest
+import pytest_asyncio
+
+@pytest_asyncio.fixture
+async def client_and_db(api_env):
+    await api_env.db.tickets.insert_one({
+        "id": "t1", "ticket_number": "INC1", "status": "open", "assigned_agent": None,
+        "user_telegram_id": "", "user_telegram_name": "@user", "category": "HSI INDIBIZ", "description": "x",
+        "created_at": "2025-01-01T00:00:00+00:00"
+    })
+    return api_env.client, api_env.db
+
+@pytest.mark.asyncio
+async def test_concurrent_claims_end_in_one_winner(client_and_db):
+    client, db = client_and_db
+
+    responses = await asyncio.gather(*(
+        client.put("/api/tickets/t1", json={"assigned_agent": agent, "assigned_agent_name": agent, "status": "in_progress"})
+        for agent in ["agent1", "agent2"]
+    ))
+
+    assert sorted(r.status_code for r in responses) == [200, 409]
+    winner = next(r.json() for r in responses if r.status_code == 200)
+    assert winner["version"] == 1
+    assert (await db.tickets.find_one({"id": "t1"}))["assigned_agent"] == winner["assigned_agent"]
+
+@pytest.mark.asyncio
+async def test_same_agent_can_update_claimed_ticket(client_and_db):
+    client, _ = client_and_db
+    await client.put("/api/tickets/t1", json={"assigned_agent": "agent1", "assigned_agent_name": "agent1", "status": "in_progress"})
+
+    response = await client.put("/api/tickets/t1", json={"assigned_agent": "agent1", "status": "pending"})
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "pending"
+
+@pytest.mark.asyncio
+async def test_stale_expected_version_is_rejected(client_and_db):
+    client, _ = client_and_db
+
+    assert (await client.put("/api/tickets/t1", json={"status": "pending", "expected_version": 0})).status_code == 200
+    response = await client.put("/api/tickets/t1", json={"status": "in_progress", "expected_version": 0})
+
+    assert response.status_code == 409
+
+@pytest.mark.asyncio
+async def test_update_missing_ticket_is_404(client_and_db):
+    client, _ = client_and_db
+    response = await client.put("/api/tickets/nope", json={"status": "pending"})
+    assert response.status_code == 404
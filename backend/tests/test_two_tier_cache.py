@@ -0,0 +1,25 @@
+import pytest
+from unittest.mock import AsyncMock
+from app.services.two_tier_cache import TwoTierCache
+
+fakeredis = pytest.importorskip("fakeredis")
+
+@pytest.mark.asyncio
+async def test_local_then_redis_then_reload_after_invalidate():
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    cache = TwoTierCache("test")
+    loader = AsyncMock(return_value=["HSI", "VPN IP"])
+
+    assert await cache.get_or_load("categories", loader, redis) == ["HSI", "VPN IP"]
+    assert await cache.get_or_load("categories", loader, redis) == ["HSI", "VPN IP"]
+    assert loader.await_count == 1
+
+    # Another worker: empty local tier, served from Redis
+    other_worker = TwoTierCache("test")
+    assert await other_worker.get_or_load("categories", loader, redis) == ["HSI", "VPN IP"]
+    assert loader.await_count == 1
+
+    await cache.invalidate(redis, "categories")
+    loader.return_value = ["HSI"]
+    assert await cache.get_or_load("categories", loader, redis) == ["HSI"]
+    assert loader.await_count == 2
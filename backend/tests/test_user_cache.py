@@ -0,0 +1,43 @@
+import pytest
+from unittest.mock import AsyncMock
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+from app.core.deps import get_user_from_token
+from app.core.security import create_access_token
+from app.core.user_cache import UserCache, user_cache, publish_user_change
+from app.models.user import User
+
+@pytest.fixture(autouse=True)
+def clear_user_cache():
+    user_cache.clear()
+    yield
+    user_cache.clear()
+
+@pytest.mark.asyncio
+async def test_token_resolved_once_then_invalidated():
+    db = AsyncMongoMockClient()["test_db"]
+    await db.users.insert_one({"id": "u1", "username": "agent1", "role": "agent", "status": "approved"})
+    token = create_access_token({"sub": "agent1"})
+
+    assert (await get_user_from_token(token, db)).id == "u1"
+    await db.users.delete_one({"id": "u1"})
+    # Served from the cache, no users lookup
+    assert (await get_user_from_token(token, db)).id == "u1"
+
+    redis = AsyncMock()
+    await publish_user_change("u1", redis)
+    redis.publish.assert_awaited_once()
+    with pytest.raises(HTTPException) as exc:
+        await get_user_from_token(token, db)
+    assert exc.value.status_code == 401
+
+def test_cache_is_bounded_and_respects_token_expiry():
+    cache = UserCache(max_size=2)
+    users = [User(id=f"u{i}", username=f"user{i}") for i in range(3)]
+    for i, user in enumerate(users):
+        cache.put(f"t{i}", user)
+    assert len(cache) == 2
+    assert cache.get("t0") is None
+
+    cache.put("expired", users[0], token_exp=0)
+    assert cache.get("expired") is None
@@ -0,0 +1,108 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock
+from app.models.user import User
+from app.routers import webhook
+from app.services import idempotency
+
+def ticket_payload(**overrides):
+    return {
+        "user_telegram_id": "111", "user_telegram_name": "@budi",
+        "category": "HSI", "description": "Internet mati", **overrides
+    }
+
+@pytest_asyncio.fixture
+async def client_and_db(api_env, monkeypatch):
+    await api_env.db.tickets.create_index("ticket_number", unique=True)
+    monkeypatch.setattr(webhook.assignment, "assign_new_ticket", AsyncMock(return_value=None))
+    monkeypatch.setattr(webhook.assignment, "assign_new_tickets", AsyncMock(return_value={}))
+    return api_env.client, api_env.db, api_env.redis
+
+@pytest.mark.asyncio
+async def test_bulk_webhook_reports_per_item_results(client_and_db):
+    client, db, redis = client_and_db
+    await db.tickets.insert_one({"id": "old", "ticket_number": "INC-DUP"})
+
+    response = await client.post("/api/webhook/telegram/bulk", json=[
+        ticket_payload(),
+        {"user_telegram_id": "111"},
+        ticket_payload(ticket_number="INC-DUP"),
+        ticket_payload(description="Lambat")
+    ])
+    assert response.status_code == 200
+    body = response.json()
+
+    assert [r["status"] for r in body["results"]] == ["created", "error", "error", "created"]
+    assert body["created"] == 2 and body["failed"] == 2
+    assert await db.tickets.count_documents({}) == 3
+    # Cache invalidated once for the whole batch
+    assert await redis.get("dataver:global") == "1"
+    # Assigned as one batch
+    webhook.assignment.assign_new_tickets.assert_awaited_once()
+    assert len(webhook.assignment.assign_new_tickets.await_args.args[0]) == 2
+
+@pytest.mark.asyncio
+async def test_bulk_webhook_rejects_oversized_batch(client_and_db):
+    client, _, _ = client_and_db
+    response = await client.post("/api/webhook/telegram/bulk", json=[ticket_payload()] * (webhook.BULK_MAX_TICKETS + 1))
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_bulk_webhook_requires_staff(client_and_db, api_env):
+    client, _, _ = client_and_db
+    api_env.user = User(id="u1", username="u1", role="user", status="approved")
+    response = await client.post("/api/webhook/telegram/bulk", json=[ticket_payload()])
+    assert response.status_code == 403
+
+@pytest.mark.asyncio
+async def test_webhook_idempotency_key_replays_original_ticket(client_and_db):
+    client, db, _ = client_and_db
+    headers = {"Idempotency-Key": "tg-111-42"}
+
+    first = await client.post("/api/webhook/telegram", json=ticket_payload(), headers=headers)
+    retry = await client.post("/api/webhook/telegram", json=ticket_payload(), headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json()["ticket_number"] == first.json()["ticket_number"]
+    assert await db.tickets.count_documents({}) == 1
+    assert webhook.assignment.assign_new_ticket.await_count == 1
+
+@pytest.mark.asyncio
+async def test_webhook_idempotency_key_released_on_failure(client_and_db, monkeypatch):
+    client, db, redis = client_and_db
+    await db.tickets.insert_one({"id": "old", "ticket_number": "INC-DUP"})
+
+    response = await client.post("/api/webhook/telegram", json=ticket_payload(ticket_number="INC-DUP"), headers={"Idempotency-Key": "k1"})
+    assert response.status_code == 409
+    assert await redis.get("idempotency:webhook:k1") is None
+
+@pytest.mark.asyncio
+async def test_generated_ticket_numbers_are_sequential(client_and_db):
+    client, _, _ = client_and_db
+    single = (await client.post("/api/webhook/telegram", json=ticket_payload())).json()
+    bulk = (await client.post("/api/webhook/telegram/bulk", json=[ticket_payload(), ticket_payload()])).json()
+
+    numbers = [single["ticket_number"]] + [r["ticket_number"] for r in bulk["results"]]
+    assert numbers == sorted(numbers)
+    assert [int(n[-6:]) for n in numbers] == [1, 2, 3]
+
+@pytest.mark.asyncio
+async def test_retry_waits_for_in_flight_attempt(client_and_db, monkeypatch):
+    client, _, redis = client_and_db
+    monkeypatch.setattr(idempotency, "IN_FLIGHT_POLL_SECONDS", 0.01)
+    first = idempotency.IdempotencyGuard("webhook", "k2", redis)
+    await first.__aenter__()
+
+    async def finish_first_attempt():
+        await asyncio.sleep(0.05)
+        first.response = {"id": "first", "ticket_number": "INC-FIRST", "status": "open", **ticket_payload()}
+        await first.__aexit__(None, None, None)
+
+    retry, _ = await asyncio.gather(
+        client.post("/api/webhook/telegram", json=ticket_payload(), headers={"Idempotency-Key": "k2"}),
+        finish_first_attempt()
+    )
+
+    assert retry.status_code == 200
+    assert retry.json()["ticket_number"] == "INC-FIRST"
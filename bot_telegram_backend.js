@@ -3,6 +3,7 @@ const axios = require('axios');
 const chalk = require('chalk');
 const Redis = require('ioredis');
 const FormData = require('form-data');
+const crypto = require('crypto');
 require('dotenv').config();
 
 // ========== CONFIGURATION ==========
@@ -14,6 +15,11 @@ if (!botToken) {
 const bot = new Telegraf(botToken);
 
 const API_URL = process.env.API_URL || 'https://roc-6-sdv-bges.site/api';
+// Service API key (see backend/generate_api_key.py), used only for calls the bot makes on its
+// own behalf (userId = BOT_SERVICE); falls back to logging in as the first admin when unset.
+// Actions an admin takes in Telegram always run under that admin's own login.
+const BOT_API_KEY = process.env.BOT_API_KEY;
+const BOT_SERVICE = 'bot-service';
 const GROUP_CHAT_ID = process.env.GROUP_CHAT_ID || -1002537753569;
 const ADMIN_IDS = [913319004, 298974745, 851931779, 943209523, 571820015, 101722263, 114891561, 63352873, 110042692, 100539709, 5085656866, 1143912090, 99730157, 72726170, 267675364];
 
@@ -91,17 +97,21 @@ async function getOrLoginAdminToken(userId) {
     return await loginAdmin(userId);
 }
 
-async function apiRequest(method, endpoint, data = null, userId = null) {
+async function apiRequest(method, endpoint, data = null, userId = null, extraHeaders = {}) {
+    const useServiceKey = userId === BOT_SERVICE && BOT_API_KEY;
+    const adminId = userId === BOT_SERVICE ? ADMIN_IDS[0] : userId;
     try {
         const config = {
             method,
             url: `${API_URL}${endpoint}`,
-            headers: {},
+            headers: { ...extraHeaders },
             timeout: 10000  // 10 second timeout
         };
 
-        if (userId && ADMIN_IDS.includes(userId)) {
-            const token = await getOrLoginAdminToken(userId);
+        if (useServiceKey) {
+            config.headers['X-API-Key'] = BOT_API_KEY;
+        } else if (adminId && ADMIN_IDS.includes(adminId)) {
+            const token = await getOrLoginAdminToken(adminId);
             if (token) {
                 config.headers['Authorization'] = `Bearer ${token}`;
             }
@@ -115,11 +125,11 @@ async function apiRequest(method, endpoint, data = null, userId = null) {
         const response = await axios(config);
         return { success: true, data: response.data };
     } catch (error) {
-        if (error.response?.status === 401 && userId) {
-            await redis.del(`bot:admin_token:${userId}`);
-            const token = await loginAdmin(userId);
+        if (error.response?.status === 401 && adminId && !useServiceKey) {
+            await redis.del(`bot:admin_token:${adminId}`);
+            const token = await loginAdmin(adminId);
             if (token) {
-                return apiRequest(method, endpoint, data, userId);
+                return apiRequest(method, endpoint, data, userId, extraHeaders);
             }
         }
         logError(`API Request failed: ${error.message}`);
@@ -138,11 +148,17 @@ async function uploadImageToServer(ctx, fileId) {
         const response = await axios.get(fileUrl, { responseType: 'arraybuffer' });
         const buffer = Buffer.from(response.data);
 
-        // Get admin token for upload
-        const token = await getOrLoginAdminToken(ADMIN_IDS[0]);
-        if (!token) {
-            logError('Failed to get admin token for image upload');
-            return null;
+        // The upload is the bot's own call: service key if configured, else the first admin's login
+        let authHeaders;
+        if (BOT_API_KEY) {
+            authHeaders = { 'X-API-Key': BOT_API_KEY };
+        } else {
+            const token = await getOrLoginAdminToken(ADMIN_IDS[0]);
+            if (!token) {
+                logError('Failed to get admin token for image upload');
+                return null;
+            }
+            authHeaders = { 'Authorization': `Bearer ${token}` };
         }
 
         // Create form data
@@ -156,7 +172,7 @@ async function uploadImageToServer(ctx, fileId) {
         const uploadResponse = await axios.post(`${API_URL}/uploads/upload`, formData, {
             headers: {
                 ...formData.getHeaders(),
-                'Authorization': `Bearer ${token}`
+                ...authHeaders
             }
         });
 
@@ -208,19 +224,14 @@ async function safeAnswerCbQuery(ctx, text = null) {
 // ========== BOT HANDLERS ==========
 bot.start(async (ctx) => {
     const fullName = ctx.from.first_name + (ctx.from.last_name ? ' ' + ctx.from.last_name : '');
-    const usernameTelegram = ctx.from.username ? `@${ctx.from.username}` : '';
     const userId = ctx.from.id;
     await setUserState(userId, { step: 'mainMenu' });
 
     // User biasa - cek tiket aktif
     try {
-        // Use first admin ID to authenticate request
-        const result = await apiRequest('GET', '/tickets', null, ADMIN_IDS[0]);
+        const result = await apiRequest('GET', `/tickets/telegram-user/${userId}`, null, BOT_SERVICE);
         if (result.success) {
-            const activeTickets = result.data.filter(t =>
-                t.user_telegram_name?.toLowerCase() === usernameTelegram.toLowerCase() &&
-                t.status !== 'completed'
-            );
+            const activeTickets = result.data.active;
 
             if (activeTickets.length >= 10) {
                 let tiketList = activeTickets.map(t => `- *${t.ticket_number}*`).join('\n');
@@ -283,20 +294,14 @@ bot.command('lapor', async (ctx) => {
 // Command: /status - Cek status tiket user
 bot.command('status', async (ctx) => {
     logAction(ctx, 'Command /status');
-    const usernameTelegram = ctx.from.username ? `@${ctx.from.username}` : '';
-
-    if (!usernameTelegram) {
-        return ctx.reply('❌ Anda perlu memiliki username Telegram untuk menggunakan fitur ini.');
-    }
 
     try {
-        const result = await apiRequest('GET', '/tickets', null, ADMIN_IDS[0]);
+        const result = await apiRequest('GET', `/tickets/telegram-user/${ctx.from.id}?completed_limit=5`, null, BOT_SERVICE);
         if (result.success) {
-            const userTickets = result.data.filter(t =>
-                t.user_telegram_name?.toLowerCase() === usernameTelegram.toLowerCase()
-            );
+            const activeTickets = result.data.active;
+            const completedTickets = result.data.completed;
 
-            if (userTickets.length === 0) {
+            if (activeTickets.length === 0 && completedTickets.length === 0) {
                 return ctx.reply(
                     '📋 *Status Tiket Anda*\n\n' +
                     'Anda belum memiliki tiket.\n' +
@@ -305,9 +310,6 @@ bot.command('status', async (ctx) => {
                 );
             }
 
-            const activeTickets = userTickets.filter(t => t.status !== 'completed');
-            const completedTickets = userTickets.filter(t => t.status === 'completed').slice(0, 5);
-
             let message = '*📋 Status Tiket Anda*\n\n';
 
             if (activeTickets.length > 0) {
@@ -745,7 +747,7 @@ bot.on('photo', async (ctx) => {
             };
 
             // Use special endpoint for bot to add comment
-            const result = await apiRequest('POST', '/tickets/bot-comments', commentData, ADMIN_IDS[0]);
+            const result = await apiRequest('POST', '/tickets/bot-comments', commentData, BOT_SERVICE);
 
             if (result.success) {
                 await ctx.reply(`✅ Gambar untuk tiket *${ticketNumber}* berhasil dikirim.`, { parse_mode: 'Markdown' });
@@ -788,7 +790,7 @@ bot.on('text', async (ctx) => {
             };
 
             // Use special endpoint for bot to add comment
-            const result = await apiRequest('POST', '/tickets/bot-comments', commentData, ADMIN_IDS[0]); // Use first admin ID for auth
+            const result = await apiRequest('POST', '/tickets/bot-comments', commentData, BOT_SERVICE);
 
             if (result.success) {
                 await ctx.reply(`✅ Balasan Anda untuk tiket *${ticketNumber}* berhasil dikirim.`, { parse_mode: 'Markdown' });
@@ -872,6 +874,7 @@ bot.on('text', async (ctx) => {
         );
 
         state.step = 'confirmSubmit';
+        state.draftId = crypto.randomUUID(); // Idempotency key for every submit of this draft
         await setUserState(userId, state);
         return;
     }
@@ -919,6 +922,7 @@ bot.on('text', async (ctx) => {
         );
 
         state.step = 'confirmSubmit';
+        state.draftId = crypto.randomUUID(); // Idempotency key for every submit of this draft
         await setUserState(userId, state);
         return;
     }
@@ -987,6 +991,7 @@ bot.on('text', async (ctx) => {
     );
 
     state.step = 'confirmSubmit';
+    state.draftId = crypto.randomUUID(); // Idempotency key for every submit of this draft
     await setUserState(userId, state);
 });
 
@@ -1039,7 +1044,11 @@ bot.action('submit', async (ctx) => {
     };
 
     try {
-        const result = await apiRequest('POST', '/tickets', ticketData, ADMIN_IDS[0]); // Updated endpoint to /tickets
+        // Every tap on SUBMIT for this draft sends the same key, so a retry after a timeout
+        // returns the ticket created by the first attempt instead of creating another one
+        // (drafts confirmed before draftId existed fall back to the update id)
+        const idempotencyKey = `tg-${userId}-${state.draftId || ctx.update.update_id}`;
+        const result = await apiRequest('POST', '/tickets', ticketData, BOT_SERVICE, { 'Idempotency-Key': idempotencyKey }); // Updated endpoint to /tickets
 
         if (!result.success) {
             await ctx.reply('Gagal membuat tiket. Silahkan coba lagi.');
@@ -1281,7 +1290,7 @@ bot.action(/^reply_ticket_(.+)/, async (ctx) => {
 
     try {
         // Fetch ticket to get number and status
-        const result = await apiRequest('GET', `/tickets/${ticketId}`, null, ADMIN_IDS[0]);
+        const result = await apiRequest('GET', `/tickets/${ticketId}`, null, BOT_SERVICE);
         if (!result.success) {
             return ctx.answerCbQuery('Gagal mengambil data tiket.');
         }
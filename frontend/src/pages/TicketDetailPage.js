@@ -31,22 +31,87 @@ export default function TicketDetailPage({ user }) {
   const [imagePreviews, setImagePreviews] = useState([]);
   const [uploadingImage, setUploadingImage] = useState(false);
   const fileInputRef = useRef(null);;
+  const commentsRef = useRef([]);
+  const initialCommentsRef = useRef(null);
 
   useEffect(() => {
     fetchTicket();
-    fetchComments();
+    initialCommentsRef.current = fetchComments();
     if (user.role === 'admin') {
       fetchAgents();
     }
   }, [ticketId]);
 
-  // Auto-refresh comments every 10 seconds
   useEffect(() => {
-    const interval = setInterval(() => {
-      fetchComments();
-    }, 10000); // 10 seconds
+    commentsRef.current = comments;
+  }, [comments]);
 
-    return () => clearInterval(interval);
+  // Receive new comments over the notifications WebSocket instead of polling
+  useEffect(() => {
+    const token = localStorage.getItem('token');
+    let wsBaseUrl = API;
+    if (wsBaseUrl.startsWith('/')) {
+      const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+      wsBaseUrl = `${protocol}//${window.location.host}${wsBaseUrl}`;
+    }
+    const wsUrl = wsBaseUrl.replace('http', 'ws').replace('/api', '/api/notifications/ws');
+    let ws = null;
+    let pingInterval = null;
+    let reconnectTimer = null;
+    let hasConnected = false;
+    let unmounted = false;
+
+    const connect = () => {
+      ws = new WebSocket(`${wsUrl}?token=${token}`);
+
+      ws.onopen = () => {
+        ws.send(JSON.stringify({ action: 'subscribe', topic: `ticket:${ticketId}` }));
+        // Catch up on comments posted before this subscribe took effect: while the
+        // socket was down, or between the initial fetch and the first subscribe
+        if (hasConnected) {
+          fetchNewComments();
+        } else {
+          Promise.resolve(initialCommentsRef.current).then(fetchNewComments);
+        }
+        hasConnected = true;
+        pingInterval = setInterval(() => {
+          if (ws.readyState === WebSocket.OPEN) {
+            ws.send('ping');
+          }
+        }, 30000);
+      };
+
+      ws.onmessage = (event) => {
+        if (event.data === 'pong') return;
+
+        try {
+          const data = JSON.parse(event.data);
+          if (data.type === 'new_comment' && data.data.ticket_id === ticketId) {
+            appendComments([data.data]);
+          }
+        } catch (error) {
+          console.error('WebSocket message error:', error);
+        }
+      };
+
+      ws.onclose = () => {
+        clearInterval(pingInterval);
+        if (!unmounted) {
+          reconnectTimer = setTimeout(connect, 5000);
+        }
+      };
+    };
+
+    connect();
+
+    return () => {
+      unmounted = true;
+      clearTimeout(reconnectTimer);
+      clearInterval(pingInterval);
+      if (ws) {
+        ws.close();
+      }
+    };
   }, [ticketId]);
 
   const fetchTicket = async () => {
@@ -63,12 +128,38 @@ export default function TicketDetailPage({ user }) {
   const fetchComments = async () => {
     try {
       const response = await axios.get(`${API}/tickets/${ticketId}/comments`);
+      commentsRef.current = response.data;
       setComments(response.data);
     } catch (error) {
       console.error('Failed to fetch comments');
     }
   };
 
+  // Only fetch comments newer than the last one we have
+  const fetchNewComments = async () => {
+    const last = commentsRef.current[commentsRef.current.length - 1];
+    if (!last) {
+      fetchComments();
+      return;
+    }
+    try {
+      const response = await axios.get(`${API}/tickets/${ticketId}/comments`, {
+        params: { since: last.timestamp }
+      });
+      appendComments(response.data);
+    } catch (error) {
+      console.error('Failed to fetch comments');
+    }
+  };
+
+  const appendComments = (newComments) => {
+    setComments((prev) => {
+      const seen = new Set(prev.map((c) => c.id));
+      const fresh = newComments.filter((c) => !seen.has(c.id));
+      return fresh.length > 0 ? [...prev, ...fresh] : prev;
+    });
+  };
+
   const fetchAgents = async () => {
     try {
       const response = await axios.get(`${API}/users/agents`);
@@ -141,7 +232,7 @@ export default function TicketDetailPage({ user }) {
     }
 
     try {
-      await axios.post(`${API}/tickets/${ticketId}/comments`, {
+      const response = await axios.post(`${API}/tickets/${ticketId}/comments`, {
         comment: newComment || '[Gambar]',
         images: uploadedImages.length > 0 ? uploadedImages : null
       });
@@ -149,7 +240,7 @@ export default function TicketDetailPage({ user }) {
       setNewComment('');
       setImageFiles([]);
       setImagePreviews([]);
-      fetchComments();
+      appendComments([response.data]);
     } catch (error) {
       toast.error('Failed to add comment');
     }
@@ -117,6 +117,21 @@ export default function TicketsPage({ user }) {
               icon: '/favicon.ico'
             });
           }
+        } else if (data.type === 'ticket_assigned') {
+          fetchOpenTickets();
+          fetchTickets();
+          if (data.data.agent_id === user.id) {
+            toast.success(`📌 Tiket ${data.data.ticket_number} otomatis ditugaskan kepada Anda`);
+            playNotificationSound();
+
+            // Browser notification
+            if (Notification.permission === 'granted') {
+              new Notification('Tiket Ditugaskan', {
+                body: `Tiket ${data.data.ticket_number} ditugaskan kepada Anda`,
+                icon: '/favicon.ico'
+              });
+            }
+          }
         }
       } catch (error) {
         console.error('WebSocket message error:', error);